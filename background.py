@@ -1,19 +0,0 @@
-from flask import Flask
-from flask import request
-from threading import Thread
-import time
-import requests
-
-
-app = Flask('')
-
-@app.route('/')
-def home():
-  return "I'm alive"
-
-def run():
-  app.run(host='0.0.0.0', port=8080)
-
-def keep_alive():
-  t = Thread(target=run)
-  t.start()
\ No newline at end of file
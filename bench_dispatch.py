@@ -0,0 +1,97 @@
+"""Бенчмарк накладных расходов диспетчера на одно сообщение в диалоге.
+
+Запуск: python bench_dispatch.py [--messages 20000]
+
+Импортирует main с настоящими dp и middleware во временном каталоге,
+заводит двух пользователей в диалоге и прогоняет апдейты через
+dp.feed_update. Пересылка заменена пустой функцией, поэтому замер - это
+стоимость пути от апдейта до хендлера: с FastPathMiddleware и через
+полную цепочку фильтров (fast_path.enabled = False).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:ABCdefGhIJKlmnoPQRstuVWXyz0123456789")
+os.environ.setdefault("RATE_LIMITS", "text=1000000000,media=1000000000,sticker=1000000000")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.chdir(tempfile.mkdtemp())
+
+import main  # noqa: E402
+from aiogram.dispatcher.event.handler import HandlerObject  # noqa: E402
+from aiogram.types import Chat, Message, Sticker, Update, User  # noqa: E402
+
+USER, RIVAL = 1001, 1002
+
+
+def make_updates(count: int) -> dict:
+    chat = Chat(id=USER, type="private")
+    sender = User(id=USER, is_bot=False, first_name="user")
+    sticker = Sticker(file_id="s", file_unique_id="s", type="regular", width=1, height=1,
+                      is_animated=False, is_video=False)
+    kinds = {
+        "text": dict(text="привет, как дела?"),
+        "sticker": dict(sticker=sticker),
+    }
+    return {
+        kind: [
+            Update(update_id=i, message=Message(
+                message_id=i, date=datetime.now(), chat=chat, from_user=sender, **fields
+            ))
+            for i in range(count)
+        ]
+        for kind, fields in kinds.items()
+    }
+
+
+async def measure(updates: list) -> float:
+    started = time.perf_counter()
+    for update in updates:
+        await main.dp.feed_update(main.bot, update)
+    return (time.perf_counter() - started) / len(updates)
+
+
+async def run(count: int):
+    delivered = []
+
+    async def relay(message, user_state=None):
+        delivered.append(message.message_id)
+
+    # Пересылка без сети: и короткий путь, и обычный хендлер попадают в relay
+    main.fast_path.relay = relay
+    for index, handler in enumerate(main.dp.message.handlers):
+        if handler.callback is main.handler_message:
+            main.dp.message.handlers[index] = HandlerObject(callback=relay, filters=handler.filters)
+
+    main.db.new_user(USER)
+    main.db.new_user(RIVAL)
+    main.db.start_chat(USER, RIVAL)
+
+    updates = make_updates(count)
+    print(f"{count} сообщений каждого вида, {len(main.dp.message.handlers)} хендлеров сообщений")
+    print(f"{'kind':>8}{'chain us':>10}{'fast us':>10}{'speedup':>9}")
+    for kind, batch in updates.items():
+        await measure(batch[:200])  # прогрев
+        main.fast_path.enabled = False
+        chain = await measure(batch)
+        main.fast_path.enabled = True
+        fast = await measure(batch)
+        print(f"{kind:>8}{chain * 1e6:>10.1f}{fast * 1e6:>10.1f}{chain / fast:>8.2f}x")
+    # Каждый апдейт дошёл до пересылки: короткий путь ничего не потерял
+    assert len(delivered) == sum(2 * len(batch) + 200 for batch in updates.values()), len(delivered)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages))
+
+
+if __name__ == "__main__":
+    cli()
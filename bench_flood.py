@@ -0,0 +1,96 @@
+"""Проверка: сколько запросов к Bot API стоит флуд одного пользователя.
+
+Запуск: python bench_flood.py [--messages 5000] [--window 0.05]
+
+Импортирует main с настоящими dp и middleware во временном каталоге,
+заводит двух пользователей в диалоге и шлёт сообщения одного из них
+пачками больше лимита. Пересылка заменена пустой функцией, а запросы к
+API перехватываются session middleware и считаются, в сеть ничего не
+уходит. Лимитер должен ответить не больше mute_after раз (предупреждения
+и сообщение о муте), после мута флуд не должен стоить ни одного запроса.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:ABCdefGhIJKlmnoPQRstuVWXyz0123456789")
+os.environ.setdefault("RATE_LIMITS", "text=20")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000, help="сообщений после мута")
+    parser.add_argument("--window", type=float, default=0.05, help="RATE_LIMIT_WINDOW, с")
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["RATE_LIMIT_WINDOW"] = str(args.window)
+os.chdir(tempfile.mkdtemp())
+
+import main  # noqa: E402
+from aiogram.dispatcher.event.handler import HandlerObject  # noqa: E402
+from aiogram.types import Chat, Message, Update, User  # noqa: E402
+
+USER, RIVAL = 1001, 1002
+
+
+def make_update(update_id: int) -> Update:
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=USER, type="private"),
+        from_user=User(id=USER, is_bot=False, first_name="user"), text="флуд",
+    ))
+
+
+async def run(messages: int, window: float):
+    api_calls = []
+
+    async def count_calls(make_request, bot, method):
+        api_calls.append(type(method).__name__)
+
+    async def relay(message, user_state=None):
+        pass
+
+    main.http_session.middleware(count_calls)
+    main.fast_path.relay = relay
+    for index, handler in enumerate(main.dp.message.handlers):
+        if handler.callback is main.handler_message:
+            main.dp.message.handlers[index] = HandlerObject(callback=relay, filters=handler.filters)
+
+    main.db.new_user(USER)
+    main.db.new_user(RIVAL)
+    main.db.start_chat(USER, RIVAL)
+
+    limiter = main.rate_limiter
+    burst = limiter.limits["text"] * 3
+    update_id = 0
+    # Пачки больше лимита в разных окнах, пока лимитер не замьютит
+    while not main.db.is_blocked(USER):
+        await asyncio.sleep(window)
+        for _ in range(burst):
+            update_id += 1
+            await main.dp.feed_update(main.bot, make_update(update_id))
+    before_mute = len(api_calls)
+
+    started = time.perf_counter()
+    for _ in range(messages):
+        update_id += 1
+        await main.dp.feed_update(main.bot, make_update(update_id))
+    elapsed = time.perf_counter() - started
+    after_mute = len(api_calls) - before_mute
+
+    print(f"до мута: {update_id - messages} сообщений, {before_mute} запросов к API ({', '.join(api_calls)})")
+    print(f"после мута: {messages} сообщений, {after_mute} запросов, {elapsed / messages * 1e6:.1f} us/сообщение")
+    print(f"лимитер: {limiter.stats}")
+    assert before_mute <= limiter.mute_after, api_calls
+    assert after_mute == 0, api_calls[before_mute:]
+
+
+if __name__ == "__main__":
+    asyncio.run(run(args.messages, args.window))
@@ -0,0 +1,93 @@
+"""Симулятор очереди поиска для сравнения стратегий подбора.
+
+Запуск: python bench_matching.py [--rate 2] [--hours 24] [--seed 1]
+Выводит пропускную способность, p95 ожидания и долю таймаутов для каждой стратегии.
+"""
+import argparse
+import math
+import random
+from datetime import datetime, timedelta
+
+from matching import STRATEGIES
+from records import Candidate, RatingInfo
+
+INTERESTS = [
+    "Ролевые игры", "Одиночество", "Игры",
+    "Аниме", "Мемы", "Флирт", "Музыка",
+    "Путешествия", "Фильмы", "Книги",
+    "Питомцы", "Спорт"
+]
+
+SEARCH_TIMEOUT = timedelta(minutes=5)  # как в check_chats_task
+SWEEP_INTERVAL = timedelta(seconds=180)
+
+
+def generate_arrivals(rate_per_min: float, hours: float, seed: int) -> list:
+    """Пуассоновский поток пользователей со случайными интересами и рейтингом"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    t, end = 0.0, hours * 3600
+    arrivals = []
+    user_id = 0
+    while True:
+        t += rng.expovariate(rate_per_min / 60)
+        if t >= end:
+            return arrivals
+        user_id += 1
+        interests = set() if rng.random() < 0.4 else set(rng.sample(INTERESTS, rng.randint(1, 2)))
+        arrivals.append((start + timedelta(seconds=t), Candidate(
+            user_id, 1, interests=frozenset(interests),
+            rating=RatingInfo(5 if rng.random() < 0.2 else 0, 5 if rng.random() < 0.1 else 0),
+        )))
+
+
+def simulate(strategy, arrivals: list) -> dict:
+    pool = []
+    waits, timeouts, matched = [], 0, 0
+    next_sweep = arrivals[0][0] + SWEEP_INTERVAL if arrivals else None
+
+    for now, user in arrivals:
+        while next_sweep <= now:
+            expired = [c for c in pool if next_sweep - c.search_started > SEARCH_TIMEOUT]
+            timeouts += len(expired)
+            pool = [c for c in pool if c not in expired]
+            next_sweep += SWEEP_INTERVAL
+
+        rival = strategy.pick(user, pool, now)
+        if rival:
+            pool.remove(rival)
+            waits.append((now - rival.search_started).total_seconds())
+            waits.append(0.0)
+            matched += 2
+        else:
+            user.search_started = now
+            pool.append(user)
+
+    total = len(arrivals)
+    hours = (arrivals[-1][0] - arrivals[0][0]).total_seconds() / 3600 if total > 1 else 1
+    waits.sort()
+    return {
+        "throughput": matched / hours,
+        # Ближайший ранг: наименьшее ожидание, не меньше которого у 95% пар
+        "p95_wait": waits[math.ceil(len(waits) * 0.95) - 1] if waits else 0.0,
+        "timeout_rate": timeouts / total if total else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=2, help="пользователей в минуту")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    arrivals = generate_arrivals(args.rate, args.hours, args.seed)
+    print(f"{len(arrivals)} поисков, {args.rate}/мин, {args.hours} ч")
+    print(f"{'strategy':<10}{'matched/h':>12}{'p95 wait, s':>14}{'timeouts':>10}")
+    for name, strategy_cls in STRATEGIES.items():
+        result = simulate(strategy_cls(), arrivals)
+        print(f"{name:<10}{result['throughput']:>12.1f}{result['p95_wait']:>14.1f}{result['timeout_rate']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
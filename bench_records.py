@@ -0,0 +1,117 @@
+"""Бенчмарк записей records.py против прежних dict(sqlite3.Row).
+
+Запуск: python bench_records.py [--users 5000] [--rounds 20]
+
+Заполняет временную базу ищущими пользователями и сравнивает два пути:
+прежний (sqlite3.Row -> dict, set интересов и datetime на каждого
+кандидата) и нынешний (row_factory сразу строит User/Candidate).
+Память - tracemalloc по удерживаемому списку кандидатов, число блоков -
+sys.getallocatedblocks до и после, время - среднее на проход.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from database import database
+
+INTERESTS = ["Ролевые игры", "Одиночество", "Игры", "Аниме", "Мемы", "Флирт", "Музыка"]
+CANDIDATES_SQL = """
+    SELECT u.id, u.interests, u.search_started,
+           COALESCE(r.positive, 0) AS positive, COALESCE(r.negative, 0) AS negative
+    FROM users u LEFT JOIN user_ratings r ON r.user_id = u.id
+    WHERE u.status = 1 AND u.id != ?
+"""
+
+
+def fill(db: database, users: int, seed: int = 1):
+    rng = random.Random(seed)
+    now = datetime.now()
+    for user_id in range(1, users + 1):
+        interests = [] if rng.random() < 0.4 else rng.sample(INTERESTS, rng.randint(1, 2))
+        db.conn.execute(
+            "INSERT INTO users (id, status, interests, search_started) VALUES (?, 1, ?, ?)",
+            (user_id, ",".join(interests), (now - timedelta(seconds=rng.randint(0, 300))).isoformat()),
+        )
+        if rng.random() < 0.3:
+            db.conn.execute(
+                "INSERT INTO user_ratings (user_id, positive, negative) VALUES (?, ?, ?)",
+                (user_id, rng.randint(0, 9), rng.randint(0, 9)),
+            )
+    db.conn.commit()
+
+
+def dict_candidates(db: database):
+    """Прежний search: dict и set на каждого кандидата"""
+    cursor = db.conn.execute(CANDIDATES_SQL, (0,))
+    return [
+        {
+            "id": row['id'],
+            "interests": set(row['interests'].split(',')) if row['interests'] else set(),
+            "positive": row['positive'],
+            "negative": row['negative'],
+            "search_started": datetime.fromisoformat(row['search_started']) if row['search_started'] else None
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+def record_candidates(db: database):
+    db.candidate_cursor.execute(CANDIDATES_SQL, (0,))
+    return db.candidate_cursor.fetchall()
+
+
+def dict_user(db: database, user_id: int):
+    """Прежний get_user_cursor"""
+    cursor = db.conn.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def measure(func, rounds: int) -> tuple:
+    func()  # прогрев кэшей разбора и подготовленных запросов
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    result = func()
+    held = tracemalloc.get_traced_memory()[0]
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    del result
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return held, blocks, (time.perf_counter() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = database(os.path.join(directory, "users.db"))
+        fill(db, args.users)
+        ids = list(range(1, args.users + 1))
+
+        cases = [
+            (f"search, {args.users} кандидатов", lambda: dict_candidates(db), lambda: record_candidates(db)),
+            (f"get_user_cursor x{len(ids)}", lambda: [dict_user(db, i) for i in ids],
+             lambda: [db.get_user_cursor(i) for i in ids]),
+        ]
+        print(f"{'path':<30}{'kind':>8}{'held KiB':>10}{'blocks':>9}{'ms':>9}")
+        for name, old, new in cases:
+            for kind, func in (("dict", old), ("record", new)):
+                held, blocks, elapsed = measure(func, args.rounds)
+                print(f"{name:<30}{kind:>8}{held / 1024:>10.0f}{blocks:>9}{elapsed * 1000:>9.2f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
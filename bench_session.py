@@ -0,0 +1,101 @@
+"""Бенчмарк HTTP-сессии ботов против локальной заглушки Bot API.
+
+Запуск: python bench_session.py [--requests 5000] [--concurrency 300] [--latency 0.02]
+
+Заглушка на 127.0.0.1 отвечает на /bot<token>/<method> через latency секунд,
+как будто это api.telegram.org. Сравниваются обычная AiohttpSession и
+TunedSession с разными размерами пула; у TunedSession видно, сколько
+соединений создано заново и сколько запросов ждали свободного слота.
+Та же заглушка годится, чтобы проверить TELEGRAM_API_URL руками.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from session import TunedSession
+
+TOKEN = "123456:stub"
+MESSAGE = {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"}
+
+
+def serve_stub(latency: float, port: int):
+    async def handle(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({"ok": True, "result": MESSAGE})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    web.run_app(app, host="127.0.0.1", port=port, access_log=None, print=None)
+
+
+def start_stub(latency: float, port: int) -> multiprocessing.Process:
+    """Заглушка в отдельном процессе, чтобы не делить event loop и CPU с клиентом"""
+    process = multiprocessing.Process(target=serve_stub, args=(latency, port), daemon=True)
+    process.start()
+    return process
+
+
+async def wait_stub(api: TelegramAPIServer):
+    for _ in range(50):
+        try:
+            await run(AiohttpSession(api=api), 1, 1)
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("заглушка Bot API не запустилась")
+
+
+async def run(session, requests: int, concurrency: int) -> tuple:
+    bot = Bot(TOKEN, session=session)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(1, f"relay {i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    await session.close()
+    latencies.sort()
+    return requests / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа заглушки, с")
+    parser.add_argument("--limits", default="100,300,500")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    stub = start_stub(args.latency, args.port)
+    api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}")
+    await wait_stub(api)
+    print(f"{args.requests} sendMessage, {args.concurrency} одновременно, ответ через {args.latency * 1000:.0f} мс")
+    print(f"{'session':>16}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'created':>9}{'reuse':>8}{'queued':>8}")
+
+    rate, p50, p95 = await run(AiohttpSession(api=api), args.requests, args.concurrency)
+    print(f"{'aiogram default':>16}{rate:>9.0f}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}{'-':>9}{'-':>8}{'-':>8}")
+    for limit in map(int, args.limits.split(",")):
+        session = TunedSession(api=api, limit=limit)
+        rate, p50, p95 = await run(session, args.requests, args.concurrency)
+        summary = session.summary()
+        print(f"{f'tuned limit={limit}':>16}{rate:>9.0f}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}"
+              f"{summary['created']:>9}{summary['reuse']:>8}{summary['queued']:>8}")
+
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
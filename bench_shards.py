@@ -0,0 +1,78 @@
+"""Бенчмарк записи message_links/messages при разном числе шардов.
+
+Запуск: python bench_shards.py [--writers 8] [--seconds 3] [--shards 1,2,4,8] [--dir .]
+
+Каждый поток-писатель открывает свой database и вызывает save_relay, как
+пересылка одного сообщения; первая строка - прежняя запись тремя commit.
+Запись в один файл SQLite разрешена только одному соединению за раз,
+поэтому с одним файлом потоки ждут друг друга, а с N файлами - только тех,
+кто попал в тот же шард.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from database import database
+
+
+def separate_commits(db: database, sender_id: int, receiver_id: int, message_id: int, sent_id: int, content: str):
+    """Как пересылка писала раньше: три вызова, три commit"""
+    db.save_message_link(sender_id, message_id, sent_id)
+    db.save_message_link(receiver_id, sent_id, message_id)
+    db.save_message(sender_id, receiver_id, content)
+
+
+def writer(path: str, shards: int, legacy: bool, deadline: float, seed: int, counts: list, index: int):
+    db = database(path, shards=shards)
+    save = (lambda *args: separate_commits(db, *args)) if legacy else db.save_relay
+    rng = random.Random(seed)
+    done = 0
+    message_id = seed * 10 ** 9
+    while time.perf_counter() < deadline:
+        message_id += 2
+        save(rng.randrange(10 ** 6), rng.randrange(10 ** 6), message_id, message_id + 1, "text")
+        done += 1
+    counts[index] = done
+    db.close()
+
+
+def run(shards: int, writers: int, seconds: float, where: str = None, legacy: bool = False) -> float:
+    with tempfile.TemporaryDirectory(dir=where) as directory:
+        path = os.path.join(directory, "users.db")
+        database(path, shards=shards).close()
+
+        counts = [0] * writers
+        deadline = time.perf_counter() + seconds
+        threads = [
+            threading.Thread(target=writer, args=(path, shards, legacy, deadline, i + 1, counts, i))
+            for i in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--dir", default=".", help="где создавать базы: нужен тот же диск, что у бота, не tmpfs")
+    args = parser.parse_args()
+
+    print(f"{args.writers} писателей, {args.seconds} с на замер")
+    print(f"{'shards':>12}{'relays/s':>12}{'speedup':>10}")
+    base = run(1, args.writers, args.seconds, args.dir, legacy=True)
+    print(f"{'1, 3 commit':>12}{base:>12.0f}{1:>9.2f}x")
+    for shards in map(int, args.shards.split(",")):
+        rate = run(shards, args.writers, args.seconds, args.dir)
+        print(f"{shards:>12}{rate:>12.0f}{rate / base:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
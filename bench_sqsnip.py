@@ -0,0 +1,93 @@
+"""Микробенчмарк: время одного апдейта для запросов прежнего database.py и для sqsnip.
+
+Запуск: python bench_sqsnip.py [--updates 20000] [--users 5000] [--repeat 5]
+
+Один "апдейт" - то же, что делает пересылка сообщения: чтение пользователя,
+поиск связанного сообщения, две записи message_links и запись в messages.
+baseline - тексты запросов из database.py до sqsnip: они уже были с "?",
+так что подготовленные выражения и там брались из кэша sqlite3, и сравнение
+показывает цену построителя, а не выигрыш от кэша. literal - значения прямо
+в тексте, как строил запросы старый sqsnip.database: каждый апдейт даёт новые
+тексты и компилируется заново. Печатается лучшее время из repeat прогонов.
+"""
+import argparse
+import random
+import sqlite3
+import time
+
+import sqsnip
+
+
+def literal_update(conn: sqlite3.Connection, user_id: int, rival_id: int, message_id: int):
+    conn.execute(f"SELECT * FROM users WHERE id = {user_id}").fetchone()
+    conn.execute(f"SELECT rival_message_id FROM message_links WHERE user_id = {user_id} AND message_id = {message_id}").fetchone()
+    conn.execute(f"INSERT OR REPLACE INTO message_links VALUES ({user_id}, {message_id}, {message_id + 1})")
+    conn.execute(f"INSERT OR REPLACE INTO message_links VALUES ({rival_id}, {message_id + 1}, {message_id})")
+    conn.execute(f"INSERT INTO messages (sender_id, receiver_id, content) VALUES ({user_id}, {rival_id}, \"text {message_id}\")")
+
+
+def baseline_update(conn: sqlite3.Connection, user_id: int, rival_id: int, message_id: int):
+    conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+    conn.execute(
+        "SELECT rival_message_id FROM message_links WHERE user_id = ? AND message_id = ?", (user_id, message_id)
+    ).fetchone()
+    conn.execute("INSERT OR REPLACE INTO message_links VALUES (?, ?, ?)", (user_id, message_id, message_id + 1))
+    conn.execute("INSERT OR REPLACE INTO message_links VALUES (?, ?, ?)", (rival_id, message_id + 1, message_id))
+    conn.execute(
+        "INSERT INTO messages (sender_id, receiver_id, content) VALUES (?, ?, ?)", (user_id, rival_id, f"text {message_id}")
+    )
+
+
+def builder_update(conn: sqlite3.Connection, user_id: int, rival_id: int, message_id: int):
+    conn.execute(*sqsnip.select("users", where={"id": user_id})).fetchone()
+    conn.execute(*sqsnip.select(
+        "message_links", "rival_message_id", {"user_id": user_id, "message_id": message_id}
+    )).fetchone()
+    for uid, mid, rmid in ((user_id, message_id, message_id + 1), (rival_id, message_id + 1, message_id)):
+        conn.execute(*sqsnip.insert(
+            "message_links", {"user_id": uid, "message_id": mid, "rival_message_id": rmid}, conflict="REPLACE"
+        ))
+    conn.execute(*sqsnip.insert(
+        "messages", {"sender_id": user_id, "receiver_id": rival_id, "content": f"text {message_id}"}
+    ))
+
+
+def run(update, updates: int, users: int, cached_statements: int) -> float:
+    """Микросекунд на апдейт"""
+    conn = sqlite3.connect(":memory:", cached_statements=cached_statements)
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, status INTEGER DEFAULT 0, rid INTEGER DEFAULT 0);
+        CREATE TABLE message_links (user_id INTEGER, message_id INTEGER, rival_message_id INTEGER,
+                                    PRIMARY KEY(user_id, message_id));
+        CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, sender_id INTEGER,
+                               receiver_id INTEGER, content TEXT);
+    """)
+    conn.executemany("INSERT INTO users (id) VALUES (?)", [(i,) for i in range(users)])
+    rng = random.Random(1)
+
+    started = time.perf_counter()
+    for message_id in range(0, updates * 2, 2):
+        update(conn, rng.randrange(users), rng.randrange(users), message_id)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed / updates * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Размер кэша выражений как у соединения в каждой версии database.py
+    variants = (("literal", literal_update, 128), ("baseline", baseline_update, 128), ("sqsnip", builder_update, 256))
+    print(f"{'':<10}{'us/update':>12}")
+    for name, update, cached_statements in variants:
+        best = min(run(update, args.updates, args.users, cached_statements) for _ in range(args.repeat))
+        print(f"{name:<10}{best:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
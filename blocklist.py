@@ -0,0 +1,86 @@
+import heapq
+from datetime import datetime
+
+
+class BlockedUsers:
+    """Заблокированные пользователи в памяти.
+
+    Проверка user_id in blocked - обычный поиск по множеству,
+    временные блокировки дополнительно лежат в куче по сроку окончания.
+    О блокировке пользователю сообщается один раз (first_notice), иначе
+    каждое его сообщение стоило бы ответного sendMessage.
+    """
+
+    def __init__(self):
+        self._until = {}  # user_id -> datetime или None (навсегда)
+        self._expiry = []  # куча (until, user_id)
+        self._notified = set()  # кому уже сообщили о текущей блокировке
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._until
+
+    def __len__(self) -> int:
+        return len(self._until)
+
+    def add(self, user_id: int, until: datetime = None):
+        self._until[user_id] = until
+        self._notified.discard(user_id)
+        if until:
+            heapq.heappush(self._expiry, (until, user_id))
+
+    def discard(self, user_id: int):
+        # Запись в куче остаётся и отбрасывается при извлечении
+        self._until.pop(user_id, None)
+        self._notified.discard(user_id)
+
+    def mark_notified(self, user_id: int):
+        """О текущей блокировке пользователю уже сообщили"""
+        if user_id in self._until:
+            self._notified.add(user_id)
+
+    def first_notice(self, user_id: int) -> bool:
+        """True - сообщить о блокировке нужно сейчас; следующие вызовы до новой блокировки дают False"""
+        if user_id in self._notified:
+            return False
+        self.mark_notified(user_id)
+        return True
+
+    def pop_expired(self, now: datetime = None) -> list:
+        """Убирает и возвращает пользователей, чей срок блокировки истёк"""
+        now = now or datetime.now()
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now:
+            until, user_id = heapq.heappop(self._expiry)
+            if user_id in self._until and self._until[user_id] == until:
+                del self._until[user_id]
+                self._notified.discard(user_id)
+                expired.append(user_id)
+        return expired
+
+    def next_expiry(self):
+        """Ближайший срок окончания блокировки или None"""
+        while self._expiry:
+            until, user_id = self._expiry[0]
+            if user_id in self._until and self._until[user_id] == until:
+                return until
+            heapq.heappop(self._expiry)
+        return None
+
+
+class UnreachableUsers:
+    """Пользователи, которые заблокировали бота: отправлять им что-либо бесполезно"""
+
+    def __init__(self):
+        self._ids = set()
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, user_id: int):
+        self._ids.add(user_id)
+
+    def discard(self, user_id: int):
+        self._ids.discard(user_id)
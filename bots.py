@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from io import BytesIO
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+
+class BotPool:
+    """Несколько ботов с общей базой и общим поиском.
+
+    Каждому пользователю пишет тот бот, через который он сам последний раз
+    писал (users.bot_id); если такой неизвестен - основной бот. Все боты
+    ходят в API через одну session и общий пул соединений. В памяти
+    держится не больше max_users последних пользователей, остальные
+    читаются из базы.
+    """
+
+    def __init__(self, db, tokens: list, session=None, max_users: int = 100000):
+        self.db = db
+        self.session = session
+        self.primary = Bot(tokens[0], session=session)
+        self.bots = {self.primary.id: self.primary}
+        for token in tokens[1:]:
+            bot = Bot(token, session=session)
+            self.bots[bot.id] = bot
+        self.max_users = max_users
+        self._user_bot = OrderedDict()
+
+    def __iter__(self):
+        """Основной бот всегда первый"""
+        return iter(self.bots.values())
+
+    def __len__(self) -> int:
+        return len(self.bots)
+
+    def webhook_path(self, bot: Bot) -> str:
+        """Основной бот остаётся на /webhook, остальные - на /webhook/<id>"""
+        return "/webhook" if bot is self.primary else f"/webhook/{bot.id}"
+
+    def for_user(self, user_id: int) -> Bot:
+        if len(self.bots) == 1:
+            return self.primary
+        bot_id = self._user_bot.get(user_id)
+        if bot_id is None:
+            bot_id = self.db.get_user_bot(user_id)
+        self._cache(user_id, bot_id)
+        return self.bots.get(bot_id, self.primary)
+
+    def remember(self, user_id: int, bot: Bot):
+        if self._user_bot.get(user_id) != bot.id:
+            self.db.set_user_bot(user_id, bot.id)
+        self._cache(user_id, bot.id)
+
+    def _cache(self, user_id: int, bot_id: int):
+        self._user_bot[user_id] = bot_id
+        self._user_bot.move_to_end(user_id)
+        if len(self._user_bot) > self.max_users:
+            self._user_bot.popitem(last=False)
+
+    async def file_for(self, source: Bot, target: Bot, file_id: str, filename: str = "file"):
+        """file_id действует только внутри своего бота: для другого бота файл перезаливается"""
+        if source.id == target.id:
+            return file_id
+        buffer = BytesIO()
+        await source.download(file_id, destination=buffer)
+        return BufferedInputFile(buffer.getvalue(), filename=filename)
+
+
+def sticker_filename(sticker) -> str:
+    """Имя файла для перезаливки стикера: по расширению Telegram отличает анимированные и видеостикеры"""
+    if sticker.is_animated:
+        return "sticker.tgs"
+    if sticker.is_video:
+        return "sticker.webm"
+    return "sticker.webp"
+
+
+class BotAffinityMiddleware:
+    """Outer middleware для dp.update: запоминает, через какого бота пишет пользователь"""
+
+    def __init__(self, pool: BotPool):
+        self.pool = pool
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None and len(self.pool) > 1:
+            self.pool.remember(user.id, data["bot"])
+        return await handler(event, data)
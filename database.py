@@ -1,29 +1,83 @@
+import glob
+import logging
+import math
+import os
+import re
 import sqlite3
+import time
 from datetime import datetime, timedelta
+import sqsnip
+from blocklist import BlockedUsers, UnreachableUsers
+from matching import MatchingStrategy, RatingStrategy
+from records import User, Candidate, ChatMessage, RatingInfo, NO_RATING, record_cursor
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum
+INCREMENTAL = 2
 
 class database:
-    def __init__(self, db_name: str):
-        self.conn = sqlite3.connect(db_name)
-        self.conn.row_factory = sqlite3.Row
+    # Объёмные таблицы с данными одного пользователя и колонка, по которой выбирается шард
+    SHARDED_TABLES = {"message_links": "user_id", "messages": "sender_id"}
+    # PRAGMA user_version: поднимать при каждом изменении схемы, иначе DDL и миграции
+    # на старте пропускаются у баз, где они уже выполнены
+    SCHEMA_VERSION = 3
+    # write_latency без новых записей затухает с этой постоянной, с
+    WRITE_LATENCY_DECAY = 10.0
+
+    def __init__(self, db_name: str, strategy: MatchingStrategy = None, shards: int = 1):
+        self.strategy = strategy or RatingStrategy()
+        self.conn = self._connect(db_name)
         self.cursor = self.conn.cursor()
-        self._create_tables()
-        self._migrate_database()
-
-    def _create_tables(self):
-        """Создание таблиц с актуальной структурой"""
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                status INTEGER DEFAULT 0,
-                rid INTEGER DEFAULT 0,
-                interests TEXT DEFAULT '',
-                blocked BOOLEAN DEFAULT 0,
-                blocked_until TEXT DEFAULT NULL,
-                search_started TEXT DEFAULT NULL
-            )
-        """)
-        
-        self.cursor.execute("""
+        # Курсоры, которые сразу собирают записи из records.py
+        self.user_cursor = record_cursor(self.conn, User)
+        self.candidate_cursor = record_cursor(self.conn, Candidate)
+        if not self._schema_current(self.conn):
+            self._create_tables()
+            if self._migrate_database():
+                self._mark_schema(self.conn)
+        # Шард 0 - основной файл, остальные - <имя>.shardN.db рядом с ним
+        self.shards = [self.conn] + [self._connect(self._shard_name(db_name, i)) for i in range(1, shards)]
+        for conn in self.shards[1:]:
+            if not self._schema_current(conn):
+                self._create_shard_tables(conn)
+                self._mark_schema(conn)
+        # Число шардов хранится в основном файле: пока оно не меняется, перебалансировка не нужна
+        if self._stored_shards() != shards:
+            self._rebalance_shards(db_name)
+        self.blocked = BlockedUsers()
+        self.unreachable = UnreachableUsers()
+        self._write_latency = 0.0
+        self._write_at = time.monotonic()
+        self._load_blocked()
+
+    @staticmethod
+    def _connect(db_name: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(db_name, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        # Действует только на новый пустой файл, поэтому до journal_mode, который уже пишет заголовок;
+        # существующие файлы переводит python maintenance.py --enable-incremental-vacuum
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    def _schema_current(self, conn: sqlite3.Connection) -> bool:
+        return conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION
+
+    def _mark_schema(self, conn: sqlite3.Connection):
+        conn.execute(f"PRAGMA user_version = {int(self.SCHEMA_VERSION)}")
+        conn.commit()
+
+    @staticmethod
+    def _shard_name(db_name: str, index: int) -> str:
+        if db_name == ":memory:":
+            return db_name
+        root, ext = os.path.splitext(db_name)
+        return f"{root}.shard{index}{ext or '.db'}"
+
+    def _create_shard_tables(self, conn: sqlite3.Connection):
+        """Таблицы, которые делятся по шардам"""
+        conn.execute("""
             CREATE TABLE IF NOT EXISTS message_links (
                 user_id INTEGER,
                 message_id INTEGER,
@@ -31,8 +85,7 @@ class database:
                 PRIMARY KEY(user_id, message_id)
             )
         """)
-        
-        self.cursor.execute("""
+        conn.execute("""
             CREATE TABLE IF NOT EXISTS messages (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 sender_id INTEGER,
@@ -41,6 +94,113 @@ class database:
                 timestamp TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        conn.commit()
+
+    @staticmethod
+    def shard_files(db_name: str) -> dict:
+        """Файлы шардов, которые есть на диске рядом с db_name: номер -> путь (без основного файла)"""
+        if db_name == ":memory:":
+            return {}
+        root, ext = os.path.splitext(db_name)
+        ext = ext or ".db"
+        pattern = re.compile(re.escape(os.path.basename(root)) + r"\.shard(\d+)" + re.escape(ext) + "$")
+        files = {}
+        for path in glob.glob(f"{glob.escape(root)}.shard*{glob.escape(ext)}"):
+            if match := pattern.match(os.path.basename(path)):
+                files[int(match.group(1))] = path
+        return dict(sorted(files.items()))
+
+    def _stored_shards(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()
+        return int(row[0]) if row else None
+
+    def _rebalance_shards(self, db_name: str, batch: int = 1000):
+        """Раскладывает строки по шардам после смены DB_SHARDS и запоминает новое число шардов.
+
+        Просматриваются все файлы: текущие шарды и лишние файлы с номером >= числа
+        шардов, оставшиеся от большего DB_SHARDS. Строка сначала записывается в свой
+        шард и только потом удаляется из старого места, так что обрыв не теряет данных,
+        но может их удвоить: строки messages из последней пачки перед обрывом останутся
+        и в старом месте, и в новом.
+
+        messages.id в шарде свой, поэтому перенесённое сообщение получает новый id выше
+        watermark export.py в новом шарде и выгружается ещё раз. Перебалансировка идёт
+        до приёма апдейтов, так что новые id в каждом шарде - сплошной диапазон; он
+        пишется в лог, чтобы повторы можно было отбросить при загрузке выгрузки.
+        """
+        n = len(self.shards)
+        extra = [path for index, path in self.shard_files(db_name).items() if index >= n]
+        sources = list(enumerate(self.shards)) + [(None, self._connect(path)) for path in extra]
+        before = [self._last_message_id(conn) for conn in self.shards]
+        try:
+            for index, conn in sources:
+                for table, key in self.SHARDED_TABLES.items():
+                    self._move_rows(conn, table, key, index, batch)
+        finally:
+            for index, conn in sources:
+                if index is None:
+                    conn.close()
+        for index, conn in enumerate(self.shards):
+            after = self._last_message_id(conn)
+            if after > before[index]:
+                mark = "messages" if index == 0 else f"messages.shard{index}"
+                logger.warning("%s: id %s..%s - сообщения, перенесённые из других шардов; "
+                               "если те уже выгружались, это повторы", mark, before[index] + 1, after)
+        if extra:
+            logger.info("Лишние файлы шардов опустели, их можно удалить: %s", ", ".join(extra))
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('shards', ?)", (n,))
+        self.conn.commit()
+
+    @staticmethod
+    def _last_message_id(conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'").fetchone()
+        return row[0] if row else 0
+
+    def _move_rows(self, conn: sqlite3.Connection, table: str, key: str, index, batch: int):
+        """Переносит из conn строки, которым место в другом шарде; index None - переносятся все"""
+        n = len(self.shards)
+        # Остаток как у Python: shard() считает user_id % n, а в SQLite % для отрицательных отрицателен
+        where = f"(({key} % {n}) + {n}) % {n} != {int(index)}" if index is not None else "1"
+        moved = 0
+        while True:
+            rows = conn.execute(f"SELECT rowid AS _rowid, * FROM {table} WHERE {where} LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                break
+            targets = set()
+            for row in rows:
+                values = {column: row[column] for column in row.keys() if column not in ("_rowid", "id")}
+                target = self.shard(row[key])
+                target.execute(*sqsnip.insert(table, values, conflict="REPLACE"))
+                targets.add(target)
+            for target in targets:
+                target.commit()
+            conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(row["_rowid"],) for row in rows])
+            conn.commit()
+            moved += len(rows)
+        if moved:
+            logger.info("Перенесено %s строк %s в другие шарды", moved, table)
+
+    def shard(self, user_id: int) -> sqlite3.Connection:
+        """Соединение с шардом, где лежат message_links и messages пользователя"""
+        return self.shards[user_id % len(self.shards)]
+
+    def _create_tables(self):
+        """Создание таблиц с актуальной структурой"""
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                status INTEGER DEFAULT 0,
+                rid INTEGER DEFAULT 0,
+                interests TEXT DEFAULT '',
+                blocked BOOLEAN DEFAULT 0,
+                blocked_until TEXT DEFAULT NULL,
+                search_started TEXT DEFAULT NULL,
+                bot_id INTEGER DEFAULT 0,
+                blocked_reason TEXT DEFAULT NULL
+            )
+        """)
+        
+        self._create_shard_tables(self.conn)
         
         # Таблица для рейтингов пользователей
         self.cursor.execute("""
@@ -59,6 +219,14 @@ class database:
             )
         """)
         
+        # Настройки самой базы, например число шардов, по которому разложены строки
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value
+            )
+        """)
+        
         self.conn.commit()
 
     def _migrate_database(self):
@@ -91,8 +259,27 @@ class database:
                     ADD COLUMN search_started TEXT DEFAULT NULL
                 """)
                 self.conn.commit()
+            if 'bot_id' not in columns:
+                self.cursor.execute("""
+                    ALTER TABLE users 
+                    ADD COLUMN bot_id INTEGER DEFAULT 0
+                """)
+                self.conn.commit()
+            if 'blocked_reason' not in columns:
+                self.cursor.execute("""
+                    ALTER TABLE users 
+                    ADD COLUMN blocked_reason TEXT DEFAULT NULL
+                """)
+                # Раньше блокировка бота пользователем тоже писалась как blocked = 1 без срока,
+                # и отличить её от бессрочного бана модератора уже нельзя
+                self.cursor.execute("""
+                    UPDATE users SET blocked_reason = 'legacy'
+                    WHERE blocked = 1 AND blocked_until IS NULL
+                """)
+                self.conn.commit()
         except sqlite3.Error as e:
-            print(f"Migration error: {e}")
+            logger.error("Migration error: %s", e)
+            return False
 
         # Создать таблицы рейтингов и last_rivals, если их нет (для обновления старых баз)
         self.cursor.execute("""
@@ -109,16 +296,20 @@ class database:
             )
         """)
         self.conn.commit()
+        return True
+
+    def _load_blocked(self):
+        """Загружает заблокированных пользователей в память"""
+        self.cursor.execute("SELECT id, blocked_until FROM users WHERE blocked = 1")
+        for row in self.cursor.fetchall():
+            until = datetime.fromisoformat(row['blocked_until']) if row['blocked_until'] else None
+            self.blocked.add(row['id'], until)
 
-    def get_user_cursor(self, user_id: int) -> dict:
+    def get_user_cursor(self, user_id: int) -> User:
         """Получение информации о пользователе"""
         try:
-            self.cursor.execute(
-                "SELECT * FROM users WHERE id = ?",
-                (user_id,)
-            )
-            result = self.cursor.fetchone()
-            return dict(result) if result else None
+            self.user_cursor.execute(*sqsnip.select("users", User.COLUMNS, {"id": user_id}))
+            return self.user_cursor.fetchone()
         except sqlite3.OperationalError as e:
             if "no such column" in str(e):
                 self._migrate_database()
@@ -127,109 +318,154 @@ class database:
 
     def new_user(self, user_id: int):
         """Добавляет нового пользователя"""
-        self.cursor.execute(
-            "INSERT OR IGNORE INTO users (id) VALUES (?)",
-            (user_id,)
-        )
+        self.cursor.execute(*sqsnip.insert("users", {"id": user_id}, conflict="IGNORE"))
         self.conn.commit()
 
     def search(self, user_id: int):
-        """Поиск подходящего собеседника с учетом рейтинга и интересов"""
+        """Поиск подходящего собеседника по стратегии self.strategy"""
         current_user = self.get_user_cursor(user_id)
         if not current_user:
             return None
 
-        now_str = datetime.now().isoformat()
+        now = datetime.now()
+        # Повторный поиск не сбрасывает время ожидания
         self.cursor.execute(
-            "UPDATE users SET status = 1, rid = 0, search_started = ? WHERE id = ?",
-            (now_str, user_id)
+            """
+            UPDATE users SET status = 1, rid = 0,
+                search_started = CASE WHEN status = 1 AND search_started IS NOT NULL
+                                      THEN search_started ELSE ? END
+            WHERE id = ?
+            """,
+            (now.isoformat(), user_id)
         )
         self.conn.commit()
 
-        user_interests = set(current_user['interests'].split(',')) if current_user['interests'] else set()
-
-        self.cursor.execute(
-            "SELECT id, interests FROM users WHERE status = 1 AND id != ?",
+        self.candidate_cursor.execute(
+            """
+            SELECT u.id, u.interests, u.search_started,
+                   COALESCE(r.positive, 0), COALESCE(r.negative, 0)
+            FROM users u LEFT JOIN user_ratings r ON r.user_id = u.id
+            WHERE u.status = 1 AND u.id != ?
+            """,
             (user_id,)
         )
-        candidates = []
-        for candidate in self.cursor.fetchall():
-            c_id, c_interests = candidate['id'], candidate['interests']
-            candidate_interests = set(c_interests.split(',')) if c_interests else set()
-
-            # Получаем рейтинг кандидата
-            c_rating = self.get_user_rating(c_id)
-            c_pos = c_rating['positive']
-            c_neg = c_rating['negative']
-
-            # Фильтр по интересам
-            if not user_interests or user_interests & candidate_interests:
-                candidates.append({
-                    "id": c_id,
-                    "interests": candidate_interests,
-                    "positive": c_pos,
-                    "negative": c_neg
-                })
-
-        # Сортируем кандидатов с учетом рейтинга и пересечения интересов:
-        # 1) Чем больше совпадений интересов - выше
-        # 2) Пользователи с >=5 негативными рейтингами идут в конец
-        # 3) Пользователи с >=5 положительными рейтингами идут в начало
-        def sort_key(c):
-            interest_score = len(user_interests & c['interests'])
-            rating_score = 0
-            if c['negative'] >= 5:
-                rating_score -= 1000  # очень низкий приоритет
-            if c['positive'] >= 5:
-                rating_score += 1000  # очень высокий приоритет
-            return (rating_score, interest_score)
-
-        candidates.sort(key=sort_key, reverse=True)
-
-        return candidates[0] if candidates else None
+        candidates = [
+            candidate for candidate in self.candidate_cursor.fetchall()
+            if candidate.id not in self.unreachable
+        ]
+
+        return self.strategy.pick(current_user, candidates, now)
 
     def start_chat(self, user_id: int, rival_id: int):
         """Начинает чат между двумя пользователями и сохраняет последний собеседник"""
-        self.cursor.executemany(
-            "UPDATE users SET status = 2, rid = ?, search_started = NULL WHERE id = ?",
-            [(rival_id, user_id), (user_id, rival_id)]
-        )
-        # Сохраняем в last_rivals для оценки и жалоб после окончания
-        self.cursor.execute("INSERT OR REPLACE INTO last_rivals (user_id, rival_id) VALUES (?, ?)", (user_id, rival_id))
-        self.cursor.execute("INSERT OR REPLACE INTO last_rivals (user_id, rival_id) VALUES (?, ?)", (rival_id, user_id))
+        for first, second in ((user_id, rival_id), (rival_id, user_id)):
+            self.cursor.execute(*sqsnip.update(
+                "users", {"status": 2, "rid": second, "search_started": None}, {"id": first}
+            ))
+            # Сохраняем в last_rivals для оценки и жалоб после окончания
+            self.cursor.execute(*sqsnip.insert(
+                "last_rivals", {"user_id": first, "rival_id": second}, conflict="REPLACE"
+            ))
         self.conn.commit()
 
     def stop_chat(self, user_id: int, rival_id: int):
         """Завершает чат между пользователями"""
-        self.cursor.executemany(
-            "UPDATE users SET status = 0, rid = 0, search_started = NULL WHERE id = ?",
-            [(user_id,), (rival_id,)]
-        )
+        for uid in (user_id, rival_id):
+            self.cursor.execute(*sqsnip.update(
+                "users", {"status": 0, "rid": 0, "search_started": None}, {"id": uid}
+            ))
         self.conn.commit()
 
     def stop_search(self, user_id: int):
         """Останавливает поиск собеседника"""
-        self.cursor.execute(
-            "UPDATE users SET status = 0, rid = 0, search_started = NULL WHERE id = ?",
-            (user_id,)
-        )
+        self.cursor.execute(*sqsnip.update(
+            "users", {"status": 0, "rid": 0, "search_started": None}, {"id": user_id}
+        ))
+        self.conn.commit()
+
+    def get_user_bot(self, user_id: int) -> int:
+        """id бота, через которого пользователь писал последним (0 - неизвестно)"""
+        self.cursor.execute(*sqsnip.select("users", "bot_id", {"id": user_id}))
+        result = self.cursor.fetchone()
+        return result[0] if result and result[0] else 0
+
+    def set_user_bot(self, user_id: int, bot_id: int):
+        self.cursor.execute(*sqsnip.update("users", {"bot_id": bot_id}, {"id": user_id}))
         self.conn.commit()
 
+    def mark_unreachable(self, user_id: int):
+        """Помечает пользователя, заблокировавшего бота, и убирает его из поиска и диалога.
+
+        Возвращает id собеседника, если был прерван диалог.
+        """
+        self.unreachable.add(user_id)
+        user = self.get_user_cursor(user_id)
+        if not user:
+            return None
+        if user.status == 2:
+            self.stop_chat(user_id, user.rid)
+            return user.rid
+        if user.status == 1:
+            self.stop_search(user_id)
+        return None
+
     def save_message_link(self, user_id: int, message_id: int, rival_message_id: int):
         """Сохраняет связь между сообщениями"""
-        self.cursor.execute(
-            "INSERT OR REPLACE INTO message_links VALUES (?, ?, ?)",
-            (user_id, message_id, rival_message_id)
-        )
-        self.conn.commit()
+        conn = self.shard(user_id)
+        conn.execute(*sqsnip.insert(
+            "message_links",
+            {"user_id": user_id, "message_id": message_id, "rival_message_id": rival_message_id},
+            conflict="REPLACE"
+        ))
+        conn.commit()
+
+    def save_relay(self, sender_id: int, receiver_id: int, message_id: int, sent_message_id: int, content: str):
+        """Сохраняет пересылку: связи сообщений обеих сторон и текст, по одному commit на шард.
+
+        Транзакция следующего шарда начинается только после commit предыдущего,
+        чтобы не держать блокировки двух файлов сразу.
+        """
+        started = time.perf_counter()
+        statements = {}
+        for conn, query in (
+            (self.shard(sender_id), sqsnip.insert(
+                "message_links",
+                {"user_id": sender_id, "message_id": message_id, "rival_message_id": sent_message_id},
+                conflict="REPLACE"
+            )),
+            (self.shard(sender_id), sqsnip.insert(
+                "messages", {"sender_id": sender_id, "receiver_id": receiver_id, "content": content}
+            )),
+            (self.shard(receiver_id), sqsnip.insert(
+                "message_links",
+                {"user_id": receiver_id, "message_id": sent_message_id, "rival_message_id": message_id},
+                conflict="REPLACE"
+            )),
+        ):
+            statements.setdefault(conn, []).append(query)
+        for conn, queries in statements.items():
+            for query in queries:
+                conn.execute(*query)
+            conn.commit()
+        latency = self.write_latency
+        self._write_latency = latency + 0.1 * (time.perf_counter() - started - latency)
+        self._write_at = time.monotonic()
+
+    @property
+    def write_latency(self) -> float:
+        """Сглаженное время записи пересылки - сигнал нагрузки на диск.
+
+        Одна медленная запись в тишине иначе держала бы сигнал до следующей
+        пересылки, поэтому он затухает со временем и без записей.
+        """
+        idle = time.monotonic() - self._write_at
+        return self._write_latency * math.exp(-idle / self.WRITE_LATENCY_DECAY)
 
     def get_rival_message_id(self, user_id: int, message_id: int) -> int:
         """Получает ID связанного сообщения"""
-        self.cursor.execute(
-            "SELECT rival_message_id FROM message_links WHERE user_id = ? AND message_id = ?",
-            (user_id, message_id)
-        )
-        result = self.cursor.fetchone()
+        result = self.shard(user_id).execute(*sqsnip.select(
+            "message_links", "rival_message_id", {"user_id": user_id, "message_id": message_id}
+        )).fetchone()
         return result[0] if result else None
 
     def add_interest(self, user_id: int, interest: str):
@@ -252,86 +488,118 @@ class database:
 
     def get_user_interests(self, user_id: int) -> list:
         """Возвращает список интересов пользователя"""
-        self.cursor.execute(
-            "SELECT interests FROM users WHERE id = ?",
-            (user_id,)
-        )
+        self.cursor.execute(*sqsnip.select("users", "interests", {"id": user_id}))
         result = self.cursor.fetchone()
         return result[0].split(',') if result and result[0] else []
 
     def _update_interests(self, user_id: int, interests: list):
         """Обновляет интересы пользователя в базе"""
-        self.cursor.execute(
-            "UPDATE users SET interests = ? WHERE id = ?",
-            (','.join(interests), user_id)
-        )
+        self.cursor.execute(*sqsnip.update("users", {"interests": ','.join(interests)}, {"id": user_id}))
         self.conn.commit()
 
-    def get_users_in_long_search(self, time_threshold: datetime):
-        """Возвращает пользователей, которые в поиске дольше time_threshold"""
-        self.cursor.execute(
-            "SELECT * FROM users WHERE status = 1 AND search_started IS NOT NULL"
-        )
-        users = []
-        for row in self.cursor.fetchall():
-            if row['search_started']:
-                started = datetime.fromisoformat(row['search_started'])
-                if started < time_threshold:
-                    users.append(dict(row))
-        return users
-
-    def get_expired_blocks(self, now: datetime):
-        """Возвращает пользователей с истёкшим временем блокировки"""
-        self.cursor.execute(
-            "SELECT * FROM users WHERE blocked = 1 AND blocked_until IS NOT NULL"
-        )
-        users = []
-        for row in self.cursor.fetchall():
-            if row['blocked_until']:
-                until = datetime.fromisoformat(row['blocked_until'])
-                if until < now:
-                    users.append(dict(row))
-        return users
-
-    def block_user(self, user_id: int, block_until: datetime = None, permanent=False):
+    def block_user(self, user_id: int, block_until: datetime = None, permanent=False, reason: str = "moderator"):
         if permanent:
-            self.cursor.execute(
-                "UPDATE users SET blocked = 1, blocked_until = NULL WHERE id = ?",
-                (user_id,)
-            )
-        else:
-            until_str = block_until.isoformat() if block_until else None
-            self.cursor.execute(
-                "UPDATE users SET blocked = 1, blocked_until = ? WHERE id = ?",
-                (until_str, user_id)
-            )
+            block_until = None
+        self.cursor.execute(*sqsnip.update(
+            "users",
+            {"blocked": 1, "blocked_until": block_until.isoformat() if block_until else None, "blocked_reason": reason},
+            {"id": user_id}
+        ))
+        if self.cursor.rowcount:
+            self.blocked.add(user_id, block_until)
         self.conn.commit()
 
     def unblock_user(self, user_id: int):
+        self.cursor.execute(*sqsnip.update(
+            "users", {"blocked": 0, "blocked_until": None, "blocked_reason": None}, {"id": user_id}
+        ))
+        self.blocked.discard(user_id)
+        self.conn.commit()
+
+    def unblock_legacy(self, user_id: int) -> bool:
+        """Снимает блокировку, которую старые версии ставили, когда пользователь блокировал бота.
+
+        Баны модератора и муты не трогает. True - блокировка снята.
+        """
+        if user_id not in self.blocked:
+            return False
         self.cursor.execute(
-            "UPDATE users SET blocked = 0, blocked_until = NULL WHERE id = ?",
+            """
+            UPDATE users SET blocked = 0, blocked_until = NULL, blocked_reason = NULL
+            WHERE id = ? AND blocked = 1 AND blocked_reason = 'legacy'
+            RETURNING id
+            """,
             (user_id,)
         )
+        unblocked = self.cursor.fetchone() is not None
+        self.conn.commit()
+        if unblocked:
+            self.blocked.discard(user_id)
+        return unblocked
+
+    def is_blocked(self, user_id: int) -> bool:
+        """Проверка блокировки без обращения к базе; истёкшие блокировки снимаются"""
+        if user_id not in self.blocked:
+            return False
+        now = datetime.now()
+        next_expiry = self.blocked.next_expiry()
+        if next_expiry and next_expiry <= now:
+            self.release_expired_blocks(now)
+        return user_id in self.blocked
+
+    def release_expired_blocks(self, now: datetime = None) -> list:
+        """Снимает все истёкшие временные блокировки одним UPDATE, возвращает id разблокированных"""
+        now = now or datetime.now()
+        expired = set(self.blocked.pop_expired(now))
+        self.cursor.execute(
+            """
+            UPDATE users SET blocked = 0, blocked_until = NULL, blocked_reason = NULL
+            WHERE blocked = 1 AND blocked_until IS NOT NULL AND blocked_until < ?
+            RETURNING id
+            """,
+            (now.isoformat(),)
+        )
+        expired.update(row[0] for row in self.cursor.fetchall())
         self.conn.commit()
+        for user_id in expired:
+            self.blocked.discard(user_id)
+        return list(expired)
 
-    def save_message(self, sender_id: int, receiver_id: int, content: str):
+    def expire_searches(self, time_threshold: datetime) -> list:
+        """Останавливает одним UPDATE все поиски, начатые раньше time_threshold, возвращает id"""
         self.cursor.execute(
-            "INSERT INTO messages (sender_id, receiver_id, content) VALUES (?, ?, ?)",
-            (sender_id, receiver_id, content)
+            """
+            UPDATE users SET status = 0, rid = 0, search_started = NULL
+            WHERE status = 1 AND search_started IS NOT NULL AND search_started < ?
+            RETURNING id
+            """,
+            (time_threshold.isoformat(),)
         )
+        expired = [row[0] for row in self.cursor.fetchall()]
         self.conn.commit()
+        return expired
+
+    def save_message(self, sender_id: int, receiver_id: int, content: str):
+        conn = self.shard(sender_id)
+        conn.execute(*sqsnip.insert(
+            "messages", {"sender_id": sender_id, "receiver_id": receiver_id, "content": content}
+        ))
+        conn.commit()
 
     def get_chat_log(self, user1_id: int, user2_id: int, limit=10):
-        self.cursor.execute('''
-            SELECT * FROM messages 
-            WHERE (sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?)
-            ORDER BY timestamp DESC LIMIT ?
-        ''', (user1_id, user2_id, user2_id, user1_id, limit))
-        return [dict(row) for row in self.cursor.fetchall()]
+        # Сообщения каждой стороны лежат в шарде отправителя
+        messages = []
+        for sender_id, receiver_id in ((user1_id, user2_id), (user2_id, user1_id)):
+            messages += record_cursor(self.shard(sender_id), ChatMessage).execute(*sqsnip.select(
+                "messages", ChatMessage.COLUMNS, {"sender_id": sender_id, "receiver_id": receiver_id},
+                order_by="timestamp DESC", limit=limit
+            )).fetchall()
+        messages.sort(key=lambda message: message.timestamp, reverse=True)
+        return messages[:limit]
 
     def add_rating(self, user_id: int, rating: int):
         """Добавляет рейтинг пользователю: rating = 1 (положительный) или -1 (негативный)"""
-        self.cursor.execute("SELECT positive, negative FROM user_ratings WHERE user_id = ?", (user_id,))
+        self.cursor.execute(*sqsnip.select("user_ratings", ("positive", "negative"), {"user_id": user_id}))
         row = self.cursor.fetchone()
         if row:
             positive, negative = row['positive'], row['negative']
@@ -339,33 +607,63 @@ class database:
                 positive += 1
             else:
                 negative += 1
-            self.cursor.execute(
-                "UPDATE user_ratings SET positive = ?, negative = ? WHERE user_id = ?",
-                (positive, negative, user_id)
-            )
+            self.cursor.execute(*sqsnip.update(
+                "user_ratings", {"positive": positive, "negative": negative}, {"user_id": user_id}
+            ))
         else:
             positive = 1 if rating > 0 else 0
             negative = 1 if rating < 0 else 0
-            self.cursor.execute(
-                "INSERT INTO user_ratings (user_id, positive, negative) VALUES (?, ?, ?)",
-                (user_id, positive, negative)
-            )
+            self.cursor.execute(*sqsnip.insert(
+                "user_ratings", {"user_id": user_id, "positive": positive, "negative": negative}
+            ))
         self.conn.commit()
 
-    def get_user_rating(self, user_id: int):
-        self.cursor.execute("SELECT positive, negative FROM user_ratings WHERE user_id = ?", (user_id,))
+    def get_user_rating(self, user_id: int) -> RatingInfo:
+        self.cursor.execute(*sqsnip.select("user_ratings", ("positive", "negative"), {"user_id": user_id}))
         row = self.cursor.fetchone()
-        if row:
-            return {"positive": row["positive"], "negative": row["negative"]}
-        else:
-            return {"positive": 0, "negative": 0}
+        return RatingInfo(row["positive"], row["negative"]) if row else NO_RATING
 
     def get_last_rival(self, user_id: int):
         """Возвращает id последнего собеседника пользователя"""
-        self.cursor.execute("SELECT rival_id FROM last_rivals WHERE user_id = ?", (user_id,))
+        self.cursor.execute(*sqsnip.select("last_rivals", "rival_id", {"user_id": user_id}))
         row = self.cursor.fetchone()
         return row["rival_id"] if row else None
 
+    def ping(self) -> bool:
+        """Проверка, что база отвечает"""
+        try:
+            self.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def analyze(self):
+        """Обновляет статистику планировщика запросов во всех файлах"""
+        for conn in self.shards:
+            conn.execute("ANALYZE")
+            conn.commit()
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Возвращает в ОС до pages свободных страниц из каждого файла, возвращает сколько осталось свободных.
+
+        Файлы без auto_vacuum = INCREMENTAL пропускаются: перевести их можно
+        только полным VACUUM, это делает python maintenance.py при остановленном боте.
+        """
+        free = 0
+        for conn in self.shards:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL:
+                continue
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            free += conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return free
+
+    def wal_checkpoint(self, mode: str = "PASSIVE") -> list:
+        """Переносит WAL в основные файлы; TRUNCATE ещё и обрезает WAL до нуля"""
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(mode)
+        return [tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()) for conn in self.shards]
+
     def close(self):
-        """Закрывает соединение с базой данных"""
-        self.conn.close()
+        """Закрывает соединения с базой данных"""
+        for conn in self.shards:
+            conn.close()
@@ -0,0 +1,157 @@
+"""Потоковая выгрузка messages, user_ratings и last_rivals в сжатые JSONL-сегменты.
+
+Запуск: python export.py [--db users.db] [--out exports] [--chunk 1000] [--segment-rows 100000] [--full]
+
+Таблицы читаются страницами по ключу (WHERE key > ? LIMIT ?), поэтому память
+не зависит от размера таблиц, а бот может писать в базу между страницами.
+Файлы открываются только на чтение (mode=ro): выгрузка не создаёт таблиц,
+не меняет journal_mode и не конкурирует с ботом за запись. Шарды messages
+берутся из файлов users.shardN.db, которые есть на диске, поэтому DB_SHARDS
+выгрузке знать не нужно.
+После смены DB_SHARDS перенесённые сообщения получают в новом шарде новые id
+и выгружаются повторно; их диапазоны бот пишет в лог при перебалансировке.
+messages только дополняется, и по умолчанию выгружаются лишь строки после
+сохранённого watermark; user_ratings и last_rivals меняются на месте и
+выгружаются целиком.
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+from datetime import datetime
+from urllib.request import pathname2url
+
+import sqsnip
+from database import database
+
+# Таблицы для выгрузки и ключ, по которому идёт постраничное чтение
+EXPORT_TABLES = {"messages": "id", "user_ratings": "user_id", "last_rivals": "user_id"}
+INCREMENTAL_TABLES = {"messages"}
+
+
+class SegmentWriter:
+    """Пишет строки в файлы <prefix>-00000.jsonl.gz, начиная новый каждые segment_rows строк"""
+
+    def __init__(self, directory: str, prefix: str, segment_rows: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_rows = segment_rows
+        self.paths = []
+        self._file = None
+        self._rows = 0
+
+    def write(self, row: dict):
+        if self._file is None or self._rows >= self.segment_rows:
+            self._open_next()
+        self._file.write(json.dumps(row, ensure_ascii=False))
+        self._file.write("\n")
+        self._rows += 1
+
+    def _open_next(self):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.prefix}-{len(self.paths):05}.jsonl.gz")
+        self._file = gzip.open(path + ".part", "wt", encoding="utf-8")
+        self.paths.append(path)
+        self._rows = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            os.replace(self.paths[-1] + ".part", self.paths[-1])
+            self._file = None
+
+
+def load_watermarks(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, "watermarks.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_watermarks(out_dir: str, watermarks: dict):
+    path = os.path.join(out_dir, "watermarks.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(watermarks, f)
+    os.replace(path + ".tmp", path)
+
+
+def connect_readonly(path: str) -> sqlite3.Connection:
+    """Соединение только на чтение; отсутствующий файл - ошибка, а не новая пустая база"""
+    conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def fetch_after(conn: sqlite3.Connection, table: str, after, limit: int = 1000) -> list:
+    """Следующая страница таблицы по возрастанию ключа; блокировка чтения держится только на время запроса"""
+    key = EXPORT_TABLES[table]
+    return conn.execute(*sqsnip.select(table, where={f"{key} >": after}, order_by=key, limit=limit)).fetchall()
+
+
+def export_table(conn: sqlite3.Connection, table: str, out_dir: str, after=None,
+                 chunk: int = 1000, segment_rows: int = 100000, shard: int = 0):
+    """Выгружает строки таблицы (из шарда shard) с ключом > after. Возвращает (строк, последний ключ, файлы)"""
+    key = EXPORT_TABLES[table]
+    run = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    name = table if shard == 0 else f"{table}.shard{shard}"
+    writer = SegmentWriter(os.path.join(out_dir, table), f"{name}-{run}", segment_rows)
+    last = after if after is not None else -2 ** 63
+    total = 0
+    try:
+        while True:
+            rows = fetch_after(conn, table, last, chunk)
+            for row in rows:
+                writer.write(dict(row))
+            total += len(rows)
+            if rows:
+                last = rows[-1][key]
+            if len(rows) < chunk:
+                break
+    finally:
+        writer.close()
+    return total, last, writer.paths
+
+
+def export(db_name: str, out_dir: str, chunk: int = 1000, segment_rows: int = 100000,
+           full: bool = False) -> dict:
+    conns = {0: connect_readonly(db_name)}
+    watermarks = {} if full else load_watermarks(out_dir)
+    report = {}
+    try:
+        for index, path in database.shard_files(db_name).items():
+            conns[index] = connect_readonly(path)
+        for table in EXPORT_TABLES:
+            # У каждого шарда свои id, поэтому и watermark свой
+            for shard in conns if table in database.SHARDED_TABLES else [0]:
+                mark = table if shard == 0 else f"{table}.shard{shard}"
+                after = watermarks.get(mark) if table in INCREMENTAL_TABLES else None
+                total, last, paths = export_table(conns[shard], table, out_dir, after, chunk, segment_rows, shard)
+                if table in INCREMENTAL_TABLES and total:
+                    watermarks[mark] = last
+                    save_watermarks(out_dir, watermarks)
+                report[mark] = {"rows": total, "files": paths}
+    finally:
+        for conn in conns.values():
+            conn.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="users.db")
+    parser.add_argument("--out", default="exports")
+    parser.add_argument("--chunk", type=int, default=1000, help="строк за один запрос")
+    parser.add_argument("--segment-rows", type=int, default=100000, help="строк в одном файле")
+    parser.add_argument("--full", action="store_true", help="игнорировать watermark и выгрузить всё")
+    args = parser.parse_args()
+
+    report = export(args.db, args.out, args.chunk, args.segment_rows, args.full)
+    for table, info in report.items():
+        print(f"{table}: {info['rows']} строк, файлов: {len(info['files'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+
+class LoopLagMonitor:
+    """Измеряет задержку event loop: насколько позже положенного просыпается sleep(interval)"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(loop.time() - started - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+
+
+class InflightMiddleware:
+    """Outer middleware для dp.update: считает апдейты, которые сейчас обрабатываются"""
+
+    def __init__(self):
+        self.inflight = 0
+        self.handled = 0
+        self.last_update = None
+
+    async def __call__(self, handler, event, data):
+        self.inflight += 1
+        self.last_update = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            self.inflight -= 1
+            self.handled += 1
+
+    def idle_for(self, seconds: float) -> bool:
+        """Нет апдейтов в обработке и не было новых последние seconds секунд"""
+        return self.inflight == 0 and (
+            self.last_update is None or time.monotonic() - self.last_update >= seconds
+        )
+
+
+class HealthChecks:
+    """Маршруты /healthz (живость) и /readyz (готовность) для aiohttp-приложения"""
+
+    def __init__(self, db, bot, webhook_url: str, lag_monitor: LoopLagMonitor, updates: InflightMiddleware,
+                 max_lag: float = 1.0, max_inflight: int = 100, webhook_ttl: float = 60):
+        self.db = db
+        self.bot = bot
+        self.webhook_url = webhook_url
+        self.lag_monitor = lag_monitor
+        self.updates = updates
+        self.max_lag = max_lag
+        self.max_inflight = max_inflight
+        self.webhook_ttl = webhook_ttl
+        self._webhook_checked = 0.0
+        self._webhook_ok = False
+
+    def setup(self, app: web.Application):
+        app.router.add_get("/", self.liveness)
+        app.router.add_get("/healthz", self.liveness)
+        app.router.add_get("/readyz", self.readiness)
+
+    async def liveness(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "loop_lag": round(self.lag_monitor.lag, 4),
+            "max_loop_lag": round(self.lag_monitor.max_lag, 4),
+        })
+
+    async def webhook_registered(self) -> bool:
+        """Результат getWebhookInfo кэшируется на webhook_ttl секунд"""
+        now = time.monotonic()
+        if now - self._webhook_checked >= self.webhook_ttl:
+            try:
+                info = await self.bot.get_webhook_info()
+                self._webhook_ok = info.url == self.webhook_url
+            except Exception:
+                self._webhook_ok = False
+            self._webhook_checked = now
+        return self._webhook_ok
+
+    def mark_webhook(self, registered: bool):
+        self._webhook_ok = registered
+        self._webhook_checked = time.monotonic()
+
+    async def readiness(self, request: web.Request) -> web.Response:
+        checks = {
+            "db": self.db.ping(),
+            "webhook": await self.webhook_registered(),
+            "loop_lag": self.lag_monitor.lag <= self.max_lag,
+            "queue": self.updates.inflight <= self.max_inflight,
+        }
+        return web.json_response(
+            {
+                "status": "ok" if all(checks.values()) else "fail",
+                "checks": checks,
+                "loop_lag": round(self.lag_monitor.lag, 4),
+                "inflight": self.updates.inflight,
+                "handled": self.updates.handled,
+            },
+            status=200 if all(checks.values()) else 503
+        )
@@ -0,0 +1,165 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+
+# Контекст текущего апдейта: update_id, user_id, handler, started
+update_context = contextvars.ContextVar("update_context", default=None)
+
+logger = logging.getLogger("updates")
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+    fields = ("update_id", "user_id", "handler", "duration", "suppressed")
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.fields:
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи данные текущего апдейта"""
+
+    def filter(self, record):
+        ctx = update_context.get()
+        if ctx:
+            record.update_id = ctx["update_id"]
+            record.user_id = ctx["user_id"]
+            record.handler = ctx["handler"]
+            record.duration = round(time.monotonic() - ctx["started"], 4)
+        return True
+
+
+class DedupFilter(logging.Filter):
+    """Пропускает одинаковые записи не чаще раза в interval секунд.
+
+    Одинаковыми считаются записи с одним логгером, уровнем, шаблоном сообщения
+    и типом исключения; запись может уточнить ключ полем dedup_key
+    (extra={"dedup_key": ...}). Число подавленных повторов попадает в поле
+    suppressed следующей пропущенной записи.
+    """
+
+    def __init__(self, interval: float = 60, max_keys: int = 1024):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self._seen = {}  # key -> [время последней записи, подавлено]
+
+    def filter(self, record):
+        if record.exc_info:
+            error = record.exc_info[0]
+        else:
+            error = type(record.args[0]) if isinstance(record.args, tuple) and record.args and isinstance(record.args[0], BaseException) else None
+        key = (record.name, record.levelno, record.msg, error, getattr(record, "dedup_key", None))
+        now = time.monotonic()
+
+        entry = self._seen.pop(key, None)
+        if entry and now - entry[0] < self.interval:
+            entry[1] += 1
+            self._seen[key] = entry
+            return False
+
+        record.suppressed = entry[1] if entry else 0
+        self._seen[key] = [now, 0]
+        if len(self._seen) > self.max_keys:
+            del self._seen[next(iter(self._seen))]
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполненной очереди теряет запись, а не блокирует"""
+    dropped = 0
+
+    def prepare(self, record):
+        # В отличие от QueueHandler.prepare traceback не вклеивается в msg,
+        # а остаётся в exc_text, чтобы JsonFormatter вывел его полем exc
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = None, queue_size: int = 10000) -> logging.handlers.QueueListener:
+    """Направляет логи через очередь в фоновый поток, который пишет JSON в stdout"""
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(DedupFilter(float(os.getenv("LOG_DEDUP_SECONDS", 60))))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+
+    listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class UpdateContextMiddleware:
+    """Outer middleware для dp.update: заполняет update_context и пишет медленные апдейты"""
+
+    def __init__(self, slow_seconds: float = 1.0):
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        ctx = {
+            "update_id": event.update_id,
+            "user_id": user.id if user else None,
+            "handler": None,
+            "started": time.monotonic(),
+        }
+        update_context.set(ctx)
+        try:
+            return await handler(event, data)
+        finally:
+            duration = time.monotonic() - ctx["started"]
+            if duration >= self.slow_seconds:
+                # Медленные апдейты разных хендлеров не склеиваются в одну запись
+                logger.warning("Медленный апдейт", extra={"dedup_key": ctx["handler"]})
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Апдейт обработан")
+
+
+class HandlerNameMiddleware:
+    """Inner middleware: записывает имя выбранного хендлера в update_context"""
+
+    async def __call__(self, handler, event, data):
+        ctx = update_context.get()
+        if ctx is not None and "handler" in data:
+            ctx["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
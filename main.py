@@ -1,8 +1,12 @@
 import asyncio
+import logging
 import os
 from datetime import datetime, timedelta
-from aiogram import Bot, F, Dispatcher
-from aiogram.filters import Command
+# Таймер запуска создаётся до тяжёлых импортов, чтобы их время попало в отчёт
+from startup import StartupTimer, sync_webhook, sync_commands
+startup = StartupTimer()
+from aiogram import F, Dispatcher
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     Message,
     CallbackQuery,
@@ -14,62 +18,142 @@ from aiogram.types import (
     ChatMemberUpdated,
 )
 from aiogram.enums import ChatMemberStatus, ChatType, ParseMode
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 from database import database
 from keyboard import online
+from matching import get_strategy
+from profiling import UpdateProfiler
+from logs import setup_logging, UpdateContextMiddleware, HandlerNameMiddleware
+from health import HealthChecks, InflightMiddleware, LoopLagMonitor
+from maintenance import MaintenanceScheduler
+from reachability import ReachabilityMiddleware, ComebackMiddleware
+from bots import BotPool, BotAffinityMiddleware, sticker_filename
+from ratelimit import RateLimitMiddleware, parse_limits
+from session import TunedSession
+from waiting import SearchQueue
+from overload import OverloadController
+from records import User
+from routing import FastPathMiddleware, LINK_PATTERN, IN_CHAT, SEARCHING
 
 if not (token := os.getenv("TELEGRAM_BOT_TOKEN")):
     raise ValueError("TELEGRAM_BOT_TOKEN не установлен!")
 
+# Резервные боты с общей базой и поиском, через запятую
+EXTRA_TOKENS = [t.strip() for t in os.getenv("TELEGRAM_EXTRA_TOKENS", "").split(",") if t.strip()]
+
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://your-service-name.onrender.com")
 PORT = int(os.getenv("PORT", 10000))
+MATCH_STRATEGY = os.getenv("MATCH_STRATEGY", "fifo")
+DB_SHARDS = int(os.getenv("DB_SHARDS", 1))
+
+setup_logging()
+logger = logging.getLogger("main")
+startup.mark("imports")
 
-bot = Bot(token)
 dp = Dispatcher()
-db = database("users.db")
+dp.update.outer_middleware(startup)
+db = database("users.db", strategy=get_strategy(MATCH_STRATEGY), shards=DB_SHARDS)
+startup.mark("database")
+# Пул соединений, таймауты и адрес Bot API: HTTP_* и TELEGRAM_API_URL, см. session.py
+http_session = TunedSession.from_env()
+bots = BotPool(db, [token] + EXTRA_TOKENS, session=http_session)
+bot = bots.primary
+dp.update.outer_middleware(BotAffinityMiddleware(bots))
 
 DEVELOPER_ID = 1040929628
 
-# Middleware для проверки блокировки пользователя
+# Профилирование доли апдейтов: PROFILE_SAMPLE_RATE или /dev profile
+profiler = UpdateProfiler.from_env()
+dp.update.outer_middleware(profiler)
+
+updates = InflightMiddleware()
+dp.update.outer_middleware(updates)
+lag_monitor = LoopLagMonitor()
+maintenance = MaintenanceScheduler(db, is_quiet=lambda: updates.idle_for(30))
+
+# Под нагрузкой первыми отбрасываются реакции, оценки, уведомления и прочая второстепенная работа
+overload = OverloadController.from_env({
+    "loop_lag": lambda: lag_monitor.lag,
+    "outbound": lambda: http_session.inflight,
+    "db_write": lambda: db.write_latency,
+})
+
+dp.update.outer_middleware(UpdateContextMiddleware())
+for observer in (dp.message, dp.callback_query, dp.message_reaction, dp.my_chat_member):
+    observer.middleware(HandlerNameMiddleware())
+
+# Middleware для проверки блокировки пользователя: сообщения заблокированных
+# отбрасываются, ответ о блокировке уходит один раз за блокировку
 class BlockedUserMiddleware:
     async def __call__(self, handler, event: Message, data):
-        user = db.get_user_cursor(event.from_user.id)
-        if user:
-            now = datetime.now()
-            blocked_until = datetime.fromisoformat(user['blocked_until']) if user['blocked_until'] else None
-            if user['blocked'] or (blocked_until and blocked_until > now):
+        if db.is_blocked(event.from_user.id):
+            if db.blocked.first_notice(event.from_user.id):
                 await event.answer("🚫 Вы заблокированы и не можете использовать бота!")
-                return
+            return
         return await handler(event, data)
 
 dp.message.outer_middleware(BlockedUserMiddleware())
 
+# Ограничение частоты сообщений: RATE_LIMITS="text=20,media=8,sticker=10" за RATE_LIMIT_WINDOW секунд
+def mute_flooder(user_id: int, until: datetime):
+    db.block_user(user_id, block_until=until, reason="flood")
+    # О муте лимитер сообщает сам, BlockedUserMiddleware дальше молчит
+    db.blocked.mark_notified(user_id)
+
+rate_limiter = RateLimitMiddleware(
+    mute=mute_flooder,
+    limits=parse_limits(os.getenv("RATE_LIMITS", "")),
+    window=float(os.getenv("RATE_LIMIT_WINDOW", 10)),
+)
+dp.message.outer_middleware(rate_limiter)
+
+# Ищущие пользователи: место в очереди и оценка ожидания в сообщении поиска
+search_queue = SearchQueue()
+
 @dp.my_chat_member()
 async def handle_block(event: ChatMemberUpdated):
     if event.chat.type == ChatType.PRIVATE:
         user_id = event.from_user.id
         new_status = event.new_chat_member.status
         if new_status == ChatMemberStatus.KICKED:
-            db.block_user(user_id, permanent=True)
+            await on_unreachable(user_id)
         elif new_status == ChatMemberStatus.MEMBER:
-            db.unblock_user(user_id)
+            db.unreachable.discard(user_id)
+            # Старые версии записывали блокировку бота как бессрочный бан
+            db.unblock_legacy(user_id)
+
+async def on_unreachable(user_id: int):
+    """Пользователь заблокировал бота: убираем из поиска и завершаем его диалог"""
+    search_queue.forget(user_id)
+    rival_id = db.mark_unreachable(user_id)
+    if rival_id:
+        try:
+            await bots.for_user(rival_id).send_message(rival_id, "❌ Собеседник покинул чат.", reply_markup=online.builder("🔎 Найти чат"))
+        except TelegramAPIError:
+            pass
+
+# Пользователи, заблокировавшие бота: отправки им не уходят в API
+dp.update.outer_middleware(ComebackMiddleware(db.unreachable))
+reachability = ReachabilityMiddleware(db.unreachable, on_unreachable)
+http_session.middleware(reachability)
 
 async def check_chats_task():
     while True:
         now = datetime.now()
-        long_searches = db.get_users_in_long_search(now - timedelta(minutes=5))
-        for user in long_searches:
-            db.stop_search(user['id'])
+        expired = db.expire_searches(now - timedelta(minutes=5))
+        for user_id in expired:
+            search_queue.forget(user_id)
+        # Поиски снимаются всегда, а при нагрузке пропускаются только уведомления о них
+        if expired and overload.shed("notice"):
+            expired = []
+        for user_id in expired:
             try:
-                await bot.send_message(user['id'], "❌ Поиск автоматически остановлен из-за долгого ожидания", reply_markup=online.builder("🔎 Найти чат"))
+                await bots.for_user(user_id).send_message(user_id, "❌ Поиск автоматически остановлен из-за долгого ожидания", reply_markup=online.builder("🔎 Найти чат"))
             except Exception:
                 pass
-        
-        expired_blocks = db.get_expired_blocks(now)
-        for user in expired_blocks:
-            db.unblock_user(user['id'])
-        
+
         await asyncio.sleep(180)
 
 def get_block_keyboard(user_id: int) -> InlineKeyboardMarkup:
@@ -94,7 +178,7 @@ async def handle_report(callback: CallbackQuery):
         return
 
     messages = db.get_chat_log(callback.from_user.id, last_rival_id, limit=10)
-    log_text = "\n".join([f"{m['timestamp']} — {m['content']}" for m in reversed(messages)]) or "Пустой чат"
+    log_text = "\n".join([f"{m.timestamp} — {m.content}" for m in reversed(messages)]) or "Пустой чат"
 
     report_msg = (
         f"🚨 Жалоба от пользователя {callback.from_user.id}\n"
@@ -102,7 +186,7 @@ async def handle_report(callback: CallbackQuery):
         f"Лог последних сообщений:\n```\n{log_text}\n```"
     )
     try:
-        await bot.send_message(
+        await bots.for_user(DEVELOPER_ID).send_message(
             DEVELOPER_ID,
             report_msg,
             parse_mode=ParseMode.MARKDOWN,
@@ -145,8 +229,12 @@ async def is_private_chat(message: Message) -> bool:
     return message.chat.type == ChatType.PRIVATE
 
 @dp.message(Command("dev"))
-async def dev_menu(message: Message):
+async def dev_menu(message: Message, command: CommandObject):
     if message.from_user.id == DEVELOPER_ID:
+        if command.args:
+            await dev_subcommand(message, command.args.split())
+            return
+
         stats = {"total_users": "N/A"}
         try:
             db.cursor.execute("SELECT COUNT(*) FROM users")
@@ -157,9 +245,48 @@ async def dev_menu(message: Message):
         await message.answer(
             f"👨‍💻 Меню разработчика\n"
             f"Пользователей в базе: {stats['total_users']}\n"
-            "Жалобы направляются сюда автоматически."
+            f"В поиске: {len(search_queue)}, повторных нажатий без поиска: {search_queue.stats['repeats']}\n"
+            f"Сообщений коротким путём: {fast_path.stats['fast']}, через фильтры: {fast_path.stats['chain']}\n"
+            "Жалобы направляются сюда автоматически.\n"
+            "/dev profile <доля|off|dump> — профилирование апдейтов\n"
+            "/dev http — соединения с Bot API\n"
+            "/dev load — нагрузка, отброшенная работа и обслуживание базы"
         )
 
+async def dev_subcommand(message: Message, args: list):
+    if args[0] == "profile":
+        value = args[1] if len(args) > 1 else ""
+        if value == "off":
+            profiler.sample_rate = 0.0
+            path = profiler.dump()
+            await message.answer(f"⏹ Профилирование выключено{f', профиль: {path}' if path else ''}")
+        elif value == "dump":
+            path = profiler.dump()
+            await message.answer(f"💾 Профиль: {path}" if path else "Профиль пуст")
+        else:
+            try:
+                rate = float(value)
+            except ValueError:
+                rate = -1
+            if not 0 < rate <= 1:
+                await message.answer(
+                    f"Доля апдейтов: {profiler.sample_rate}, в профиле: {profiler.pending}\n"
+                    "/dev profile 0.05 | off | dump"
+                )
+                return
+            profiler.sample_rate = rate
+            await message.answer(f"▶️ Профилируется {rate:.0%} апдейтов, файлы в {profiler.out_dir}/")
+    elif args[0] == "load":
+        lines = [f"{key}: {value}" for key, value in overload.summary().items()]
+        lines += [f"ratelimit {key}: {value}" for key, value in rate_limiter.stats.items()]
+        lines.append(f"unreachable skipped: {reachability.skipped}")
+        lines += [f"maintenance {key}: {value}" for key, value in maintenance.stats.items()]
+        await message.answer("\n".join(lines))
+    elif args[0] == "http":
+        await message.answer("\n".join(f"{key}: {value}" for key, value in http_session.summary().items()))
+    else:
+        await message.answer("❌ Неизвестная команда")
+
 @dp.message(Command("start"))
 async def start_command(message: Message):
     if not await is_private_chat(message):
@@ -168,7 +295,7 @@ async def start_command(message: Message):
 
     user = db.get_user_cursor(message.from_user.id)
     
-    if user and user.get("status") == 2:  # Проверка, находится ли пользователь в диалоге
+    if user and user.status == 2:  # Проверка, находится ли пользователь в диалоге
         await message.answer("❌ Вы уже находитесь в диалоге.")
         return
 
@@ -189,7 +316,7 @@ async def search_command(message: Message):
         return
     await search_chat(message)
 
-@dp.message(F.text.regexp(r'https?://\S+|@\w+') | F.caption.regexp(r'https?://\S+|@\w+'))
+@dp.message(F.text.regexp(LINK_PATTERN) | F.caption.regexp(LINK_PATTERN))
 async def block_links(message: Message):
     await message.delete()
     await message.answer("❌ Отправка ссылок и упоминаний запрещена!")
@@ -200,6 +327,11 @@ async def search_chat(message: Message):
         await message.answer("🚫 Команды бота недоступны в группах.")
         return
 
+    # Повторное нажатие во время поиска: только свежая оценка, без прохода поиска и проверки подписки
+    if search_queue.is_fresh(message.from_user.id):
+        await show_wait(message)
+        return
+
     if not await is_subscribed(message.from_user.id):
         subscribe_markup = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="✅ Подписаться", url="https://t.me/freedom346")],
@@ -213,23 +345,23 @@ async def search_chat(message: Message):
 
     user = db.get_user_cursor(message.from_user.id)
     if user:
+        search_queue.searched(message.from_user.id, user.interests)
         rival = db.search(message.from_user.id)
 
         if not rival:
-            await message.answer(
-                "🔎 Ищем собеседника...",
-                reply_markup=online.builder("❌ Завершить поиск")
-            )
+            search_queue.wait(message.from_user.id, user.interests)
+            await show_wait(message)
         else:
+            search_queue.matched(message.from_user.id)
+            search_queue.matched(rival.id)
+
             # Уведомление о совпадении интересов
             interests_text = ""
-            user_interests = set(user['interests'].split(',')) if isinstance(user['interests'], str) else user['interests']
-            rival_interests = set(rival['interests'].split(',')) if isinstance(rival['interests'], str) else rival['interests']
-            common_interests = user_interests & rival_interests
+            common_interests = user.interests & rival.interests
             if common_interests:
                 interests_text = f" (интересы: {', '.join(common_interests)})"
 
-            db.start_chat(message.from_user.id, rival["id"])
+            db.start_chat(message.from_user.id, rival.id)
             text = (
                 f"Собеседник найден 🐵{interests_text}\n"
                 "/next — искать нового собеседника\n"
@@ -238,7 +370,14 @@ async def search_chat(message: Message):
                 f"<code>{'https://t.me/Anonchatyooubot'}</code>"
             )
             await message.answer(text, parse_mode=ParseMode.HTML, reply_markup=online.builder("❌ Завершить диалог"))
-            await bot.send_message(rival["id"], text, parse_mode=ParseMode.HTML, reply_markup=online.builder("❌ Завершить диалог"))
+            await bots.for_user(rival.id).send_message(rival.id, text, parse_mode=ParseMode.HTML, reply_markup=online.builder("❌ Завершить диалог"))
+
+async def show_wait(message: Message):
+    sent = await message.answer(
+        search_queue.text(message.from_user.id),
+        reply_markup=online.builder("❌ Завершить поиск")
+    )
+    search_queue.follow(message.from_user.id, bots.for_user(message.from_user.id), sent)
 
 @dp.callback_query(F.data == "check_sub")
 async def check_subscription(callback: CallbackQuery):
@@ -256,8 +395,8 @@ async def stop_command(message: Message):
         return
 
     user = db.get_user_cursor(message.from_user.id)
-    if user and user.get("status") == 2:
-        rival_id = user["rid"]
+    if user and user.status == 2:
+        rival_id = user.rid
         db.stop_chat(message.from_user.id, rival_id)
 
         feedback_markup = InlineKeyboardMarkup(inline_keyboard=[
@@ -267,13 +406,16 @@ async def stop_command(message: Message):
         ])
 
         for user_id in [message.from_user.id, rival_id]:
-            await bot.send_message(
-                user_id,
-                "Диалог завершен.\nОставьте мнение о собеседнике:\n"
-                f"<code>{'https://t.me/Anonchatyooubot'}</code>",
-                parse_mode=ParseMode.HTML,
-                reply_markup=feedback_markup
-            )
+            try:
+                await bots.for_user(user_id).send_message(
+                    user_id,
+                    "Диалог завершен.\nОставьте мнение о собеседнике:\n"
+                    f"<code>{'https://t.me/Anonchatyooubot'}</code>",
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=feedback_markup
+                )
+            except TelegramForbiddenError:
+                pass
     else:
         await message.answer("✅ Диалог уже завершен.", reply_markup=online.builder("🔎 Найти чат"))
 
@@ -282,7 +424,7 @@ async def handle_rate_good(callback: CallbackQuery):
     user_id = callback.from_user.id
     rival_id = db.get_last_rival(user_id)
     if rival_id:
-        db.add_rating(rival_id, 1)  # Добавляем положительный рейтинг
+        overload.defer("rating", db.add_rating, rival_id, 1)  # Добавляем положительный рейтинг
         await callback.answer("✅ Спасибо за положительную оценку!")
     else:
         await callback.answer("❌ Не удалось найти собеседника для оценки.", show_alert=True)
@@ -293,7 +435,7 @@ async def handle_rate_bad(callback: CallbackQuery):
     user_id = callback.from_user.id
     rival_id = db.get_last_rival(user_id)
     if rival_id:
-        db.add_rating(rival_id, -1)  # Добавляем отрицательный рейтинг
+        overload.defer("rating", db.add_rating, rival_id, -1)  # Добавляем отрицательный рейтинг
         await callback.answer("❌ Спасибо за отрицательную оценку!")
     else:
         await callback.answer("❌ Не удалось найти собеседника для оценки.", show_alert=True)
@@ -304,6 +446,9 @@ async def interests_command(message: Message):
     if not await is_private_chat(message):
         await message.answer("🚫 Команды бота недоступны в группах.")
         return
+    if overload.shed("interests"):
+        await message.answer("⏳ Бот перегружен, настройте интересы чуть позже.")
+        return
 
     interests = [
         "Ролевые игры", "Одиночество", "Игры",
@@ -329,6 +474,10 @@ async def interest_handler(callback: CallbackQuery):
         await callback.answer("🚫 Команды бота недоступны в группах.")
         return
 
+    if overload.shed("interests"):
+        await callback.answer("⏳ Бот перегружен, попробуйте чуть позже.")
+        return
+
     interest = callback.data.split("_", 1)[1]
     try:
         db.add_interest(callback.from_user.id, interest)
@@ -355,8 +504,8 @@ async def next_command(message: Message):
         return
 
     user = db.get_user_cursor(message.from_user.id)
-    if user and user.get("status") == 2:
-        rival_id = user["rid"]
+    if user and user.status == 2:
+        rival_id = user.rid
         db.stop_chat(message.from_user.id, rival_id)
 
         feedback_markup = InlineKeyboardMarkup(inline_keyboard=[
@@ -366,13 +515,16 @@ async def next_command(message: Message):
         ])
 
         for user_id in [message.from_user.id, rival_id]:
-            await bot.send_message(
-                user_id,
-                "Диалог завершен.\nОставьте мнение о собеседнике:\n"
-                f"<code>{'https://t.me/Anonchatyooubot'}</code>",
-                parse_mode=ParseMode.HTML,
-                reply_markup=feedback_markup
-            )
+            try:
+                await bots.for_user(user_id).send_message(
+                    user_id,
+                    "Диалог завершен.\nОставьте мнение о собеседнике:\n"
+                    f"<code>{'https://t.me/Anonchatyooubot'}</code>",
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=feedback_markup
+                )
+            except TelegramForbiddenError:
+                pass
         
         # Убираем кнопку завершения диалога и показываем кнопку поиска
         await message.answer("✅ Диалог завершен.", reply_markup=online.builder("🔎 Найти чат"))
@@ -381,13 +533,16 @@ async def next_command(message: Message):
         await search_chat(message)
 
 @dp.message(Command("link"))
-async def link_command(message: Message):
+async def link_command(message: Message, user_state: User):
     if not await is_private_chat(message):
         await message.answer("🚫 Команды бота недоступны в группах.")
         return
+    if overload.shed("link"):
+        await message.answer("⏳ Бот перегружен, поделитесь ссылкой чуть позже.")
+        return
 
-    user = db.get_user_cursor(message.from_user.id)
-    if user and user.get("status") == 2:
+    user = user_state
+    if user and user.status == IN_CHAT:
         try:
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(
@@ -396,8 +551,8 @@ async def link_command(message: Message):
                 )]
             ])
 
-            await bot.send_message(
-                chat_id=user["rid"],
+            await bots.for_user(user.rid).send_message(
+                chat_id=user.rid,
                 text="🔗 Ваш собеседник поделился ссылкой:",
                 reply_markup=keyboard
             )
@@ -406,14 +561,15 @@ async def link_command(message: Message):
             await message.answer("❌ Ошибка отправки")
 
 @dp.message(F.text == "❌ Завершить поиск")
-async def stop_search(message: Message):
+async def stop_search(message: Message, user_state: User):
     if not await is_private_chat(message):
         await message.answer("🚫 Команды бота недоступны в группах.")
         return
 
-    user = db.get_user_cursor(message.from_user.id)
-    if user and user.get("status") == 1:
+    user = user_state
+    if user and user.status == SEARCHING:
         db.stop_search(message.from_user.id)
+        search_queue.forget(message.from_user.id)
         await message.answer("✅ Поиск остановлен", reply_markup=online.builder("🔎 Найти чат"))
     else:
         await message.answer("❌ Активный поиск не найден")
@@ -424,12 +580,12 @@ async def stop_chat(message: Message):
 
 @dp.message_reaction()
 async def handle_reaction(event: MessageReactionUpdated):
-    if event.old_reaction == event.new_reaction:
+    if event.old_reaction == event.new_reaction or overload.shed("reaction"):
         return
 
     user = db.get_user_cursor(event.user.id)
-    if user and user.get("status") == 2 and event.new_reaction:
-        rival_id = user["rid"]
+    if user and user.status == 2 and event.new_reaction:
+        rival_id = user.rid
         try:
             original_msg_id = db.get_rival_message_id(event.user.id, event.message_id)
             if not original_msg_id:
@@ -441,127 +597,191 @@ async def handle_reaction(event: MessageReactionUpdated):
                 if r.type == "emoji"
             ]
 
-            await bot.set_message_reaction(
+            await bots.for_user(rival_id).set_message_reaction(
                 chat_id=rival_id,
                 message_id=original_msg_id,
                 reaction=reaction
             )
         except Exception as e:
-            print(f"Ошибка обработки реакции: {e}")
+            logger.warning("Ошибка обработки реакции: %s", e)
 
 @dp.message(F.chat.type == ChatType.PRIVATE)
-async def handler_message(message: Message):
-    user = db.get_user_cursor(message.from_user.id)
-    if user and user.get("status") == 2:
+async def handler_message(message: Message, user_state: User):
+    user = user_state
+    if user and user.status == IN_CHAT:
         try:
             reply_to_message_id = None
             if message.reply_to_message:
                 reply_to_message_id = db.get_rival_message_id(message.from_user.id, message.reply_to_message.message_id)
 
+            rival_bot = bots.for_user(user.rid)
+
+            async def file(file_id: str, filename: str):
+                return await bots.file_for(message.bot, rival_bot, file_id, filename)
+
             sent_msg = None
             if message.photo:
-                sent_msg = await bot.send_photo(
-                    user["rid"],
-                    message.photo[-1].file_id,
+                sent_msg = await rival_bot.send_photo(
+                    user.rid,
+                    await file(message.photo[-1].file_id, "photo.jpg"),
                     caption=message.caption,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.text:
-                sent_msg = await bot.send_message(
-                    user["rid"],
+                sent_msg = await rival_bot.send_message(
+                    user.rid,
                     message.text,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.voice:
-                sent_msg = await bot.send_audio(
-                    user["rid"],
-                    message.voice.file_id,
+                sent_msg = await rival_bot.send_audio(
+                    user.rid,
+                    await file(message.voice.file_id, "voice.ogg"),
                     caption=message.caption,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.video_note:
-                sent_msg = await bot.send_video_note(
-                    user["rid"],
-                    message.video_note.file_id,
+                sent_msg = await rival_bot.send_video_note(
+                    user.rid,
+                    await file(message.video_note.file_id, "video_note.mp4"),
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.sticker:
-                sent_msg = await bot.send_sticker(
-                    user["rid"],
-                    message.sticker.file_id,
+                sent_msg = await rival_bot.send_sticker(
+                    user.rid,
+                    await file(message.sticker.file_id, sticker_filename(message.sticker)),
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.animation:  # Обработка GIF
-                sent_msg = await bot.send_animation(
-                    user["rid"],
-                    message.animation.file_id,
+                sent_msg = await rival_bot.send_animation(
+                    user.rid,
+                    await file(message.animation.file_id, "animation.mp4"),
                     caption=message.caption,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.video:  # Обработка видео
-                sent_msg = await bot.send_video(
-                    user["rid"],
-                    message.video.file_id,
+                sent_msg = await rival_bot.send_video(
+                    user.rid,
+                    await file(message.video.file_id, "video.mp4"),
                     caption=message.caption,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.document:  # Обработка документов
-                sent_msg = await bot.send_document(
-                    user["rid"],
-                    message.document.file_id,
+                sent_msg = await rival_bot.send_document(
+                    user.rid,
+                    await file(message.document.file_id, message.document.file_name or "document"),
                     caption=message.caption,
                     reply_to_message_id=reply_to_message_id
                 )
 
             if sent_msg:
-                db.save_message_link(message.from_user.id, message.message_id, sent_msg.message_id)
-                db.save_message_link(user["rid"], sent_msg.message_id, message.message_id)
-
-                content = message.text or message.caption or ''
-                db.save_message(message.from_user.id, user["rid"], content)
+                db.save_relay(
+                    message.from_user.id, user.rid, message.message_id, sent_msg.message_id,
+                    message.text or message.caption or ''
+                )
 
         except Exception as e:
-            print(f"Ошибка пересылки сообщения: {e}")
+            logger.warning("Ошибка пересылки сообщения: %s", e)
+
+# Сообщения в диалоге идут в handler_message мимо фильтров; регистрируется после
+# BlockedUserMiddleware и rate_limiter, чтобы они по-прежнему срабатывали первыми
+fast_path = FastPathMiddleware(
+    get_user=db.get_user_cursor,
+    relay=handler_message,
+    menu_texts=("🔎 Найти чат", "❌ Завершить поиск", "❌ Завершить диалог"),
+    enabled=os.getenv("FAST_PATH", "1") != "0",
+)
+dp.message.outer_middleware(fast_path)
 
 async def is_subscribed(user_id: int) -> bool:
-    try:
-        member = await bot.get_chat_member(chat_id="@freedom346", user_id=user_id)
+    # Ответ не зависит от бота, но getChatMember для чужих пользователей гарантирован
+    # только админу канала: сначала основной бот, остальные - если он не смог
+    for pool_bot in bots:
+        try:
+            member = await pool_bot.get_chat_member(chat_id="@freedom346", user_id=user_id)
+        except Exception:
+            continue
         return member.status in [ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR]
-    except Exception:
-        return False
+    return False
+
+BOT_COMMANDS = [
+    BotCommand(command="/start", description="Начать поиск"),
+    BotCommand(command="/stop", description="Закончить диалог"),
+    BotCommand(command="/next", description="Новый собеседник"),
+    BotCommand(command="/search", description="Начать поиск"),
+    BotCommand(command="/link", description="Поделиться профилем"),
+    BotCommand(command="/interests", description="Настроить интересы"),
+    BotCommand(command="/dev", description="Меню разработчика")
+]
+
+startup.mark("handlers")
+
+async def sync_telegram_state(health: HealthChecks, max_delay: float = 60):
+    """Вебхук и команды сверяются с Telegram уже после старта сервера и меняются только при расхождении.
+
+    Без вебхука бот не получает апдейтов, поэтому попытки не кончаются:
+    пауза между ними растёт вдвое, но не больше max_delay секунд.
+    """
+    allowed_updates = dp.resolve_used_update_types()
+    attempt = 0
+    while True:
+        try:
+            changed = []
+            for pool_bot in bots:
+                if await sync_webhook(pool_bot, f"{WEBHOOK_URL}{bots.webhook_path(pool_bot)}", allowed_updates):
+                    changed.append(f"webhook {pool_bot.id}")
+                if await sync_commands(pool_bot, BOT_COMMANDS):
+                    changed.append(f"commands {pool_bot.id}")
+        except Exception as e:
+            attempt += 1
+            delay = min(2 ** attempt, max_delay)
+            logger.warning("Синхронизация с Telegram не удалась (попытка %d, повтор через %d с): %s", attempt, delay, e)
+            await asyncio.sleep(delay)
+            continue
+        health.mark_webhook(True)
+        startup.mark("telegram sync")
+        startup.report("Синхронизация с Telegram (%s)", ", ".join(changed) or "без изменений")
+        return
 
-async def on_startup(bot: Bot):
-    await bot.set_webhook(f"{WEBHOOK_URL}/webhook")
+# Ссылки на фоновые задачи: цикл событий держит только слабые, и без них задачу может собрать GC
+background_tasks = set()
 
-async def main():
-    asyncio.create_task(check_chats_task())
-
-    await bot.set_my_commands([
-        BotCommand(command="/start", description="Начать поиск"),
-        BotCommand(command="/stop", description="Закончить диалог"),
-        BotCommand(command="/next", description="Новый собеседник"),
-        BotCommand(command="/search", description="Начать поиск"),
-        BotCommand(command="/link", description="Поделиться профилем"),
-        BotCommand(command="/interests", description="Настроить интересы"),
-        BotCommand(command="/dev", description="Меню разработчика")
-    ])
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
+async def main():
     app = web.Application()
     app["bot"] = bot
 
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot
-    )
-    webhook_requests_handler.register(app, path="/webhook")
+    health = HealthChecks(db, bot, f"{WEBHOOK_URL}/webhook", lag_monitor, updates)
+    health.setup(app)
+
+    # Один диспетчер на все боты, у каждого свой путь вебхука
+    for pool_bot in bots:
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=pool_bot
+        ).register(app, path=bots.webhook_path(pool_bot))
 
     setup_application(app, dp, bot=bot)
-    await on_startup(bot)
+    startup.mark("app")
 
+    # Сначала принимаем вебхуки: очередь Telegram не ждёт сетевых вызовов запуска
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
     await site.start()
+    startup.mark("serve")
+    startup.report("Сервер принимает апдейты")
+
+    run_in_background(sync_telegram_state(health))
+    run_in_background(check_chats_task())
+    lag_monitor.start()
+    maintenance.start()
+    overload.start()
 
     await asyncio.Event().wait()
 
@@ -0,0 +1,105 @@
+"""Фоновое обслуживание базы и разовый перевод файлов в auto_vacuum = INCREMENTAL.
+
+Перевод - полный VACUUM, он переписывает файл целиком и держит запись
+на всё время работы, поэтому запускается отдельно, при остановленном боте:
+python maintenance.py --enable-incremental-vacuum users.db users.shard1.db ...
+"""
+import argparse
+import asyncio
+import logging
+import sqlite3
+import time
+
+from database import INCREMENTAL
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceScheduler:
+    """Фоновое обслуживание базы.
+
+    Каждые tick секунд снимает истёкшие блокировки одним UPDATE и делает
+    PASSIVE checkpoint WAL. Раз в analyze_every секунд обновляет статистику
+    (ANALYZE). Когда бот простаивает (is_quiet), возвращает по vacuum_pages
+    свободных страниц за тик и обрезает WAL (TRUNCATE checkpoint). Сам режим
+    auto_vacuum не меняет: файлы без INCREMENTAL пропускаются.
+    """
+
+    def __init__(self, db, is_quiet=lambda: True, tick: float = 60,
+                 analyze_every: float = 6 * 3600, vacuum_pages: int = 200):
+        self.db = db
+        self.is_quiet = is_quiet
+        self.tick = tick
+        self.analyze_every = analyze_every
+        self.vacuum_pages = vacuum_pages
+        self.stats = {"ticks": 0, "unblocked": 0, "analyze": 0, "vacuum": 0, "checkpoints": 0}
+        self._last_analyze = None
+        self._freelist = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Ошибка обслуживания базы")
+
+    def run_once(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        self.stats["ticks"] += 1
+        self.stats["unblocked"] += len(self.db.release_expired_blocks())
+
+        if self._last_analyze is None or now - self._last_analyze >= self.analyze_every:
+            started = time.perf_counter()
+            self.db.analyze()
+            self._last_analyze = now
+            self._freelist = None  # заодно перепроверим, есть ли что возвращать
+            self.stats["analyze"] += 1
+            logger.info("ANALYZE за %.3f с", time.perf_counter() - started)
+
+        if self.is_quiet():
+            if self._freelist is None or self._freelist > 0:
+                self._freelist = self.db.incremental_vacuum(self.vacuum_pages)
+                self.stats["vacuum"] += 1
+            self.db.wal_checkpoint("TRUNCATE")
+        else:
+            self.db.wal_checkpoint("PASSIVE")
+        self.stats["checkpoints"] += 1
+
+
+def enable_incremental_vacuum(path: str) -> bool:
+    """Переводит файл в auto_vacuum = INCREMENTAL полным VACUUM; False - уже переведён"""
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="файлы базы: основной и шарды")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="перевести файлы в auto_vacuum = INCREMENTAL (бот должен быть остановлен)")
+    args = parser.parse_args()
+    if not args.enable_incremental_vacuum:
+        parser.error("не выбрано действие")
+
+    for path in args.paths:
+        started = time.perf_counter()
+        changed = enable_incremental_vacuum(path)
+        status = f"переведён за {time.perf_counter() - started:.1f} с" if changed else "уже INCREMENTAL"
+        print(f"{path}: {status}")
+
+
+if __name__ == "__main__":
+    main()
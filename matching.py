@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from records import User, Candidate
+
+
+class MatchingStrategy:
+    """Базовая стратегия подбора собеседника.
+
+    От user нужны id и interests (frozenset), от candidate ещё
+    search_started и rating.
+    """
+    name = "base"
+
+    def waited(self, candidate: Candidate, now: datetime) -> float:
+        """Сколько секунд кандидат уже ждёт в поиске"""
+        started = candidate.search_started
+        return max((now - started).total_seconds(), 0.0) if started else 0.0
+
+    def accepts(self, user: User, candidate: Candidate, now: datetime) -> bool:
+        """Подходит ли кандидат пользователю: без интересов подходит любой"""
+        return not user.interests or not user.interests.isdisjoint(candidate.interests)
+
+    def score(self, user: User, candidate: Candidate, now: datetime):
+        """Чем больше, тем раньше кандидат будет выбран; по умолчанию - кто дольше ждёт"""
+        return self.waited(candidate, now)
+
+    def pick(self, user: User, candidates: list, now: datetime = None) -> Candidate:
+        """Возвращает лучшего кандидата или None"""
+        now = now or datetime.now()
+        best, best_score = None, None
+        for candidate in candidates:
+            if not self.accepts(user, candidate, now):
+                continue
+            score = self.score(user, candidate, now)
+            if best is None or score > best_score:
+                best, best_score = candidate, score
+        return best
+
+
+class RatingStrategy(MatchingStrategy):
+    """Прежнее поведение: сначала рейтинг, затем число общих интересов"""
+    name = "rating"
+
+    def score(self, user, candidate, now):
+        interest_score = len(user.interests & candidate.interests)
+        rating_score = 0
+        if candidate.rating.negative >= 5:
+            rating_score -= 1000  # очень низкий приоритет
+        if candidate.rating.positive >= 5:
+            rating_score += 1000  # очень высокий приоритет
+        return (rating_score, interest_score)
+
+
+class FifoStrategy(MatchingStrategy):
+    """Дольше ждущий идёт первым; интересы и рейтинг дают бонус в секундах ожидания.
+
+    Штраф за плохой рейтинг конечен, поэтому такой пользователь
+    тоже получит собеседника, просто позже остальных.
+    """
+    name = "fifo"
+
+    def __init__(self, interest_bonus: float = 30, positive_bonus: float = 60, negative_penalty: float = 120):
+        self.interest_bonus = interest_bonus
+        self.positive_bonus = positive_bonus
+        self.negative_penalty = negative_penalty
+
+    def score(self, user, candidate, now):
+        score = self.waited(candidate, now)
+        score += self.interest_bonus * len(user.interests & candidate.interests)
+        if candidate.rating.positive >= 5:
+            score += self.positive_bonus
+        if candidate.rating.negative >= 5:
+            score -= self.negative_penalty
+        return score
+
+
+class RelaxingStrategy(FifoStrategy):
+    """FIFO, но требование общих интересов снимается, когда кандидат ждёт дольше relax_after секунд"""
+    name = "relax"
+
+    def __init__(self, relax_after: float = 60, **kwargs):
+        super().__init__(**kwargs)
+        self.relax_after = relax_after
+
+    def accepts(self, user, candidate, now):
+        return super().accepts(user, candidate, now) or self.waited(candidate, now) >= self.relax_after
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (RatingStrategy, FifoStrategy, RelaxingStrategy)
+}
+
+
+def get_strategy(name: str) -> MatchingStrategy:
+    """Создаёт стратегию по имени (rating, fifo, relax)"""
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Неизвестная стратегия подбора: {name}") from None
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger("overload")
+
+# С какого уровня нагрузки работа отбрасывается: 1 - повышенная, 2 - перегрузка
+SHED_LEVELS = {
+    "reaction": 1,  # зеркалирование реакций
+    "notice": 1,  # уведомления check_chats_task
+    "rating": 1,  # запись оценок откладывается
+    "interests": 2,
+    "link": 2,
+}
+
+
+def parse_thresholds(value: str) -> tuple:
+    """Строка "0.2,0.5" в пороги уровней 1 и 2"""
+    first, second = (float(part) for part in value.split(","))
+    return first, second
+
+
+class OverloadController:
+    """Уровень нагрузки по сигналам и отбрасывание низкоприоритетной работы.
+
+    signals - имя -> функция без аргументов, текущее значение сигнала;
+    thresholds - имя -> (порог уровня 1, порог уровня 2). Уровень растёт
+    сразу, как только любой сигнал переходит порог, а снижается на ступень,
+    когда все сигналы recover_after секунд подряд ниже recover_ratio от
+    порогов текущего уровня. Отложенные вызовы выполняются при возврате к 0,
+    не больше flush_batch за тик: иначе очередь в max_deferred записей с commit
+    на каждую остановила бы цикл событий как раз при выходе из перегрузки.
+    """
+
+    def __init__(self, signals: dict, thresholds: dict, tick: float = 1.0,
+                 recover_after: float = 10, recover_ratio: float = 0.7, max_deferred: int = 10000,
+                 flush_batch: int = 100):
+        self.signals = signals
+        self.thresholds = thresholds
+        self.tick = tick
+        self.recover_after = recover_after
+        self.recover_ratio = recover_ratio
+        self.flush_batch = flush_batch
+        self.level = 0
+        self.stats = dict.fromkeys(SHED_LEVELS, 0)
+        self.stats.update(raised=0, recovered=0, deferred=0, flushed=0)
+        self._calm_since = None
+        self._deferred = deque(maxlen=max_deferred)
+        self._task = None
+
+    @classmethod
+    def from_env(cls, signals: dict):
+        """OVERLOAD_LOOP_LAG, OVERLOAD_OUTBOUND, OVERLOAD_DB_WRITE - пороги "уровень1,уровень2" """
+        thresholds = {
+            "loop_lag": parse_thresholds(os.getenv("OVERLOAD_LOOP_LAG", "0.2,0.5")),
+            "outbound": parse_thresholds(os.getenv("OVERLOAD_OUTBOUND", "60,150")),
+            "db_write": parse_thresholds(os.getenv("OVERLOAD_DB_WRITE", "0.05,0.2")),
+        }
+        return cls({name: signals[name] for name in thresholds}, thresholds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Ошибка оценки нагрузки")
+
+    def readings(self) -> dict:
+        return {name: signal() for name, signal in self.signals.items()}
+
+    def update(self, now: float = None) -> int:
+        now = time.monotonic() if now is None else now
+        readings = self.readings()
+        raw = max(
+            (sum(readings[name] >= limit for limit in self.thresholds[name]) for name in readings),
+            default=0,
+        )
+        if raw > self.level:
+            logger.warning("Нагрузка: уровень %d -> %d, %s", self.level, raw, readings)
+            self.level = raw
+            self.stats["raised"] += 1
+            self._calm_since = None
+        elif self.level and all(
+            readings[name] < self.thresholds[name][self.level - 1] * self.recover_ratio for name in readings
+        ):
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.recover_after:
+                logger.info("Нагрузка: уровень %d -> %d", self.level, self.level - 1)
+                self.level -= 1
+                self.stats["recovered"] += 1
+                self._calm_since = None
+        else:
+            self._calm_since = None
+
+        if self.level == 0 and self._deferred:
+            self.flush(self.flush_batch)
+        return self.level
+
+    def shed(self, kind: str) -> bool:
+        """True - работу вида kind сейчас нужно пропустить"""
+        if self.level >= SHED_LEVELS[kind]:
+            self.stats[kind] += 1
+            return True
+        return False
+
+    def defer(self, kind: str, func, *args):
+        """Выполняет func сразу или, при нагрузке, откладывает до восстановления"""
+        if not self.shed(kind):
+            return func(*args)
+        if len(self._deferred) == self._deferred.maxlen:
+            # Очередь полна: старейший вызов выполняется сейчас, а не теряется
+            old_func, old_args = self._deferred.popleft()
+            old_func(*old_args)
+        self._deferred.append((func, args))
+        self.stats["deferred"] += 1
+
+    def flush(self, limit: int = None):
+        """Выполняет отложенные вызовы, не больше limit (None - все)"""
+        for _ in range(len(self._deferred) if limit is None else min(limit, len(self._deferred))):
+            func, args = self._deferred.popleft()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("Ошибка отложенной записи")
+            self.stats["flushed"] += 1
+
+    def summary(self) -> dict:
+        return {"level": self.level, **{name: round(value, 4) for name, value in self.readings().items()}, **self.stats}
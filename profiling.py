@@ -0,0 +1,82 @@
+import os
+import random
+import time
+from datetime import datetime
+
+
+class UpdateProfiler:
+    """Outer middleware для dp.update: профилирует выбранную долю апдейтов.
+
+    Статистика копится в одном pstats.Stats и сбрасывается на диск каждые
+    rotate_every апдейтов или rotate_seconds секунд. Таймер cProfile - настенные
+    часы, поэтому ожидание Telegram API видно как время в poll/select, а SQLite -
+    как время в sqlite3.Cursor.execute. Одновременно профилируется не больше одного
+    апдейта; параллельные задачи event loop попадают в тот же профиль.
+    cProfile и pstats импортируются при первом профилируемом апдейте.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, out_dir: str = "profiles",
+                 rotate_every: int = 100, rotate_seconds: float = 600):
+        self.sample_rate = sample_rate
+        self.out_dir = out_dir
+        self.rotate_every = rotate_every
+        self.rotate_seconds = rotate_seconds
+        self._active = False
+        self._stats = None
+        self._samples = 0
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+            out_dir=os.getenv("PROFILE_DIR", "profiles"),
+            rotate_every=int(os.getenv("PROFILE_ROTATE_EVERY", 100)),
+            rotate_seconds=float(os.getenv("PROFILE_ROTATE_SECONDS", 600)),
+        )
+
+    async def __call__(self, handler, event, data):
+        if not self.sample_rate or self._active or random.random() >= self.sample_rate:
+            return await handler(event, data)
+
+        import cProfile
+
+        profile = cProfile.Profile()
+        self._active = True
+        profile.enable()
+        try:
+            return await handler(event, data)
+        finally:
+            profile.disable()
+            self._active = False
+            self._collect(profile)
+
+    @property
+    def pending(self) -> int:
+        """Апдейтов в текущем, ещё не записанном профиле"""
+        return self._samples
+
+    def _collect(self, profile):
+        if self._stats is None:
+            import pstats
+
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+        self._samples += 1
+        if (self._samples >= self.rotate_every
+                or time.monotonic() - self._started >= self.rotate_seconds):
+            self.dump()
+
+    def dump(self):
+        """Записывает накопленную статистику в файл .pstats и начинает новый профиль"""
+        path = None
+        if self._stats is not None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            name = f"updates-{datetime.now():%Y%m%d-%H%M%S}-{self._samples}.pstats"
+            path = os.path.join(self.out_dir, name)
+            self._stats.dump_stats(path)
+        self._stats = None
+        self._samples = 0
+        self._started = time.monotonic()
+        return path
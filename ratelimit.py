@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from aiogram.types import Message
+
+# Лимиты по умолчанию: сообщений за окно
+DEFAULT_LIMITS = {"text": 20, "media": 8, "sticker": 10}
+
+
+def content_kind(message: Message) -> str:
+    if message.sticker:
+        return "sticker"
+    if message.photo or message.video or message.voice or message.video_note or message.animation or message.document:
+        return "media"
+    return "text"
+
+
+def parse_limits(value: str) -> dict:
+    """Строка вида "text=20,media=8,sticker=10" в словарь лимитов"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        kind, _, limit = item.partition("=")
+        limits[kind.strip()] = int(limit)
+    return limits
+
+
+class _UserState:
+    __slots__ = ("last_seen", "windows", "strikes", "strike_window", "warned_window")
+
+    def __init__(self):
+        self.last_seen = 0.0
+        self.windows = {}  # kind -> [номер окна, счётчик прошлого окна, счётчик текущего]
+        self.strikes = 0
+        self.strike_window = 0
+        self.warned_window = -1
+
+
+class RateLimitMiddleware:
+    """Outer middleware для dp.message: скользящее окно на пользователя и тип контента.
+
+    Оценка скорости - счётчик текущего окна плюс доля счётчика прошлого окна,
+    поэтому на пользователя хранится по три числа на тип и проверка стоит O(1).
+    Превышение в окне: первое сообщение получает предупреждение, остальные
+    молча отбрасываются. После mute_after окон с превышением пользователь
+    блокируется через mute(user_id, until) на mute_for. Пользователи без
+    сообщений дольше idle_ttl секунд вытесняются, всего хранится не больше
+    max_users.
+    """
+
+    def __init__(self, mute, limits: dict = None, window: float = 10, mute_after: int = 3,
+                 mute_for: timedelta = timedelta(minutes=10), idle_ttl: float = 600, max_users: int = 50000):
+        self.mute = mute
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.window = window
+        self.mute_after = mute_after
+        self.mute_for = mute_for
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.stats = {"dropped": 0, "warned": 0, "muted": 0}
+        self._users = OrderedDict()
+
+    async def __call__(self, handler, event: Message, data):
+        if event.from_user is None:
+            return await handler(event, data)
+        now = time.monotonic()
+        state = self._touch(event.from_user.id, now)
+        if self._allow(state, content_kind(event), now):
+            return await handler(event, data)
+
+        self.stats["dropped"] += 1
+        window = int(now // self.window)
+        if state.warned_window == window:
+            return
+        state.warned_window = window
+
+        # Счёт превышений сбрасывается, если прошлое было больше mute_after * 10 окон назад
+        if window - state.strike_window > self.mute_after * 10:
+            state.strikes = 0
+        state.strikes += 1
+        state.strike_window = window
+        if state.strikes >= self.mute_after:
+            state.strikes = 0
+            self.stats["muted"] += 1
+            self.mute(event.from_user.id, datetime.now() + self.mute_for)
+            await event.answer(f"🔇 Слишком много сообщений. Бот недоступен {int(self.mute_for.total_seconds() // 60)} мин.")
+        else:
+            self.stats["warned"] += 1
+            await event.answer("⚠️ Слишком много сообщений, подождите немного.")
+
+    def _touch(self, user_id: int, now: float) -> _UserState:
+        state = self._users.pop(user_id, None)
+        if state is None:
+            state = _UserState()
+        state.last_seen = now
+        self._users[user_id] = state
+
+        # Вытесняем не больше двух старых записей за вызов
+        for _ in range(2):
+            oldest_id, oldest = next(iter(self._users.items()))
+            if oldest is state or (len(self._users) <= self.max_users and now - oldest.last_seen < self.idle_ttl):
+                break
+            del self._users[oldest_id]
+        return state
+
+    def _allow(self, state: _UserState, kind: str, now: float) -> bool:
+        position = now / self.window
+        window = int(position)
+        counter = state.windows.get(kind)
+        if counter is None:
+            counter = state.windows[kind] = [window, 0, 0]
+        elif counter[0] != window:
+            counter[1] = counter[2] if counter[0] == window - 1 else 0
+            counter[2] = 0
+            counter[0] = window
+
+        estimate = counter[1] * (1 - (position - window)) + counter[2]
+        if estimate >= self.limits.get(kind, self.limits["text"]):
+            return False
+        counter[2] += 1
+        return True
+
+    def __len__(self) -> int:
+        return len(self._users)
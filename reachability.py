@@ -0,0 +1,46 @@
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramForbiddenError
+
+from blocklist import UnreachableUsers
+
+
+class ReachabilityMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота.
+
+    Запросы в личный чат пользователя из реестра сразу завершаются
+    TelegramForbiddenError без обращения к API. Первый настоящий
+    TelegramForbiddenError от личного чата добавляет пользователя в реестр и
+    вызывает on_unreachable(user_id).
+    """
+
+    def __init__(self, registry: UnreachableUsers, on_unreachable=None):
+        self.registry = registry
+        self.on_unreachable = on_unreachable
+        self.skipped = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id in self.registry:
+            self.skipped += 1
+            raise TelegramForbiddenError(method=method, message="Forbidden: user is unreachable")
+        try:
+            return await make_request(bot, method)
+        except TelegramForbiddenError:
+            if isinstance(chat_id, int) and chat_id > 0 and chat_id not in self.registry:
+                self.registry.add(chat_id)
+                if self.on_unreachable:
+                    await self.on_unreachable(chat_id)
+            raise
+
+
+class ComebackMiddleware:
+    """Outer middleware для dp.update: любой апдейт от пользователя убирает его из реестра"""
+
+    def __init__(self, registry: UnreachableUsers):
+        self.registry = registry
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None and user.id in self.registry:
+            self.registry.discard(user.id)
+        return await handler(event, data)
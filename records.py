@@ -0,0 +1,99 @@
+from datetime import datetime
+from functools import lru_cache
+
+NO_INTERESTS = frozenset()
+
+
+@lru_cache(maxsize=4096)
+def parse_interests(raw: str) -> frozenset:
+    """Строка "Музыка,Игры" в frozenset; одинаковые строки дают один и тот же объект"""
+    if not raw:
+        return NO_INTERESTS
+    return frozenset(filter(None, raw.split(",")))
+
+
+def parse_time(raw):
+    return datetime.fromisoformat(raw) if raw else None
+
+
+class RatingInfo:
+    __slots__ = ("positive", "negative")
+
+    def __init__(self, positive: int = 0, negative: int = 0):
+        self.positive = positive
+        self.negative = negative
+
+    def __repr__(self):
+        return f"RatingInfo(positive={self.positive}, negative={self.negative})"
+
+
+# Общий объект для пользователей без оценок: таких большинство
+NO_RATING = RatingInfo()
+
+
+class User:
+    """Строка users: интересы и время разбираются один раз при чтении.
+
+    COLUMNS - порядок колонок в SELECT, row_factory собирает запись прямо
+    из кортежа курсора, без промежуточных sqlite3.Row и dict.
+    """
+    __slots__ = ("id", "status", "rid", "interests", "blocked", "blocked_until", "search_started", "bot_id", "rating")
+    COLUMNS = ("id", "status", "rid", "interests", "blocked", "blocked_until", "search_started", "bot_id")
+
+    def __init__(self, id: int, status: int = 0, rid: int = 0, interests: frozenset = NO_INTERESTS,
+                 blocked: bool = False, blocked_until: datetime = None, search_started: datetime = None,
+                 bot_id: int = 0, rating: RatingInfo = NO_RATING):
+        self.id = id
+        self.status = status
+        self.rid = rid
+        self.interests = interests
+        self.blocked = blocked
+        self.blocked_until = blocked_until
+        self.search_started = search_started
+        self.bot_id = bot_id
+        self.rating = rating
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        id, status, rid, interests, blocked, blocked_until, search_started, bot_id = row
+        return cls(id, status, rid, parse_interests(interests), bool(blocked),
+                   parse_time(blocked_until), parse_time(search_started), bot_id or 0)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id}, status={self.status}, rid={self.rid})"
+
+
+class Candidate(User):
+    """Кандидат поиска: строка users и его оценки одним SELECT ... LEFT JOIN user_ratings"""
+    __slots__ = ()
+    COLUMNS = ("id", "interests", "search_started", "positive", "negative")
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        id, interests, search_started, positive, negative = row
+        rating = RatingInfo(positive, negative) if positive or negative else NO_RATING
+        return cls(id, 1, 0, parse_interests(interests), search_started=parse_time(search_started), rating=rating)
+
+
+class ChatMessage:
+    """Строка messages для лога жалобы"""
+    __slots__ = ("id", "sender_id", "receiver_id", "content", "timestamp")
+    COLUMNS = ("id", "sender_id", "receiver_id", "content", "timestamp")
+
+    def __init__(self, id: int, sender_id: int, receiver_id: int, content: str, timestamp: str):
+        self.id = id
+        self.sender_id = sender_id
+        self.receiver_id = receiver_id
+        self.content = content
+        self.timestamp = timestamp
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        return cls(*row)
+
+
+def record_cursor(conn, record):
+    """Курсор, который сразу возвращает записи record"""
+    cursor = conn.cursor()
+    cursor.row_factory = record.row_factory
+    return cursor
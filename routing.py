@@ -0,0 +1,53 @@
+import re
+
+from aiogram.enums import ChatType
+from aiogram.types import Message
+
+from logs import update_context
+
+# users.status
+IDLE, SEARCHING, IN_CHAT = 0, 1, 2
+STATE_NAMES = {IDLE: "idle", SEARCHING: "searching", IN_CHAT: "in_chat"}
+
+# Ссылки и упоминания: тот же объект использует фильтр block_links, компилируется один раз
+LINK_PATTERN = re.compile(r'https?://\S+|@\w+')
+
+
+class FastPathMiddleware:
+    """Outer middleware для dp.message: одно чтение состояния пользователя на апдейт.
+
+    records.User кладётся в data["user_state"] (None - пользователя нет в
+    базе), имя состояния - в data["chat_state"]. Личное сообщение в диалоге,
+    которое не команда, не кнопка меню и не ссылка, сразу уходит в relay
+    мимо цепочки фильтров хендлеров; всё остальное идёт обычным путём.
+    С enabled=False состояние по-прежнему читается, но короткого пути нет.
+    """
+
+    def __init__(self, get_user, relay, menu_texts, enabled: bool = True):
+        self.get_user = get_user
+        self.relay = relay
+        self.menu_texts = frozenset(menu_texts)
+        self.enabled = enabled
+        self.stats = {"fast": 0, "chain": 0}
+
+    def needs_chain(self, message: Message) -> bool:
+        text = message.text or message.caption
+        if text is None:
+            return False
+        return text.startswith("/") or text in self.menu_texts or LINK_PATTERN.search(text) is not None
+
+    async def __call__(self, handler, event: Message, data):
+        user = self.get_user(event.from_user.id) if event.from_user else None
+        data["user_state"] = user
+        data["chat_state"] = STATE_NAMES.get(user.status, "idle") if user else "idle"
+
+        if (self.enabled and user is not None and user.status == IN_CHAT
+                and event.chat.type == ChatType.PRIVATE and not self.needs_chain(event)):
+            self.stats["fast"] += 1
+            ctx = update_context.get()
+            if ctx is not None:
+                ctx["handler"] = self.relay.__name__
+            return await self.relay(event, user_state=user)
+
+        self.stats["chain"] += 1
+        return await handler(event, data)
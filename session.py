@@ -0,0 +1,138 @@
+import os
+import time
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram.__meta__ import __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+
+# Методы с загрузкой файлов: видео и документы идут минутами, остальным хватает обычного таймаута
+UPLOAD_METHODS = ("sendVideo", "sendDocument", "sendAudio", "sendAnimation",
+                  "sendVoice", "sendVideoNote", "sendPhoto", "sendMediaGroup")
+
+
+def parse_timeouts(value: str) -> dict:
+    """Строка вида "sendVideo=300,sendMessage=10" в словарь таймаутов по методам"""
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        method, _, seconds = item.partition("=")
+        timeouts[method.strip()] = float(seconds)
+    return timeouts
+
+
+class TunedSession(AiohttpSession):
+    """AiohttpSession с настраиваемым пулом соединений и счётчиками их переиспользования.
+
+    Один экземпляр можно отдать всем ботам пула: соединения с API общие,
+    токен входит только в URL. api - адрес Bot API, в том числе своего
+    сервера telegram-bot-api; в режиме --local он снимает ограничения на
+    размер файлов и отдаёт их путями на диске.
+    """
+
+    def __init__(self, api: TelegramAPIServer = PRODUCTION, limit: int = 100, limit_per_host: int = 0,
+                 keepalive: float = 30, dns_ttl: int = 3600, timeout: float = 60, timeouts: dict = None):
+        super().__init__(api=api, limit=limit, timeout=timeout)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.timeouts = dict.fromkeys(UPLOAD_METHODS, max(timeout, 180.0))
+        self.timeouts.update(timeouts or {})
+        self.inflight = 0
+        self.stats = {"requests": 0, "errors": 0, "created": 0, "reused": 0, "queued": 0,
+                      "queued_time": 0.0, "request_time": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        """HTTP_POOL_LIMIT, HTTP_POOL_PER_HOST, HTTP_KEEPALIVE, HTTP_DNS_TTL, HTTP_TIMEOUT,
+        HTTP_METHOD_TIMEOUTS и TELEGRAM_API_URL (+ TELEGRAM_API_LOCAL=1 для сервера с --local)"""
+        api = PRODUCTION
+        if base := os.getenv("TELEGRAM_API_URL"):
+            api = TelegramAPIServer.from_base(base.rstrip("/"), is_local=os.getenv("TELEGRAM_API_LOCAL") == "1")
+        return cls(
+            api=api,
+            limit=int(os.getenv("HTTP_POOL_LIMIT", 100)),
+            limit_per_host=int(os.getenv("HTTP_POOL_PER_HOST", 0)),
+            keepalive=float(os.getenv("HTTP_KEEPALIVE", 30)),
+            dns_ttl=int(os.getenv("HTTP_DNS_TTL", 3600)),
+            timeout=float(os.getenv("HTTP_TIMEOUT", 60)),
+            timeouts=parse_timeouts(os.getenv("HTTP_METHOD_TIMEOUTS", "")),
+        )
+
+    def _trace_config(self) -> TraceConfig:
+        stats = self.stats
+        trace = TraceConfig()
+
+        async def request_start(session, context, params):
+            self.inflight += 1
+            context.started = time.monotonic()
+
+        async def request_end(session, context, params):
+            self.inflight -= 1
+            stats["requests"] += 1
+            stats["request_time"] += time.monotonic() - context.started
+
+        async def request_exception(session, context, params):
+            self.inflight -= 1
+            stats["errors"] += 1
+
+        async def queued_start(session, context, params):
+            context.queued = time.monotonic()
+
+        async def queued_end(session, context, params):
+            stats["queued"] += 1
+            stats["queued_time"] += time.monotonic() - context.queued
+
+        async def created(session, context, params):
+            stats["created"] += 1
+
+        async def reused(session, context, params):
+            stats["reused"] += 1
+
+        trace.on_request_start.append(request_start)
+        trace.on_request_end.append(request_end)
+        trace.on_request_exception.append(request_exception)
+        trace.on_connection_queued_start.append(queued_start)
+        trace.on_connection_queued_end.append(queued_end)
+        trace.on_connection_create_end.append(created)
+        trace.on_connection_reuseconn.append(reused)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        # Как в AiohttpSession, но с trace_configs
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot, method, timeout=None):
+        if timeout is None:
+            timeout = self.timeouts.get(method.__api_method__)
+        return await super().make_request(bot, method, timeout=timeout)
+
+    def summary(self) -> dict:
+        """Доля переиспользованных соединений и средние времена, для /dev http"""
+        stats = self.stats
+        connections = stats["created"] + stats["reused"]
+        return {
+            "api": self.api.base.split("/bot{token}")[0],
+            "inflight": self.inflight,
+            "requests": stats["requests"],
+            "errors": stats["errors"],
+            "reuse": round(stats["reused"] / connections, 3) if connections else None,
+            "created": stats["created"],
+            "avg_ms": round(stats["request_time"] / stats["requests"] * 1000, 1) if stats["requests"] else None,
+            "queued": stats["queued"],
+            "avg_queued_ms": round(stats["queued_time"] / stats["queued"] * 1000, 1) if stats["queued"] else None,
+        }
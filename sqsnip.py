@@ -1,101 +1,142 @@
-import sqlite3
-
-def select_elements(
-        table: list,
-        where_state: bool = False
-    ):
-    result = ""
-    if type(table) == list:
-        params = [len(table), 0]
-        for el in table:
-            if type(el) == dict:
-                if len(el) > 1:
-                    for i in el:
-                        el[i] = f"\"{el[i]}\"" if type(el[i]) == str else str(el[i])
-                        res = ", " if not where_state else " AND "
-                        result += str(i) + " = " + el[i] + ("" if params[1] == params[0] else res)
-                        params[1] += 1
-                else:
-                    params[1] += 1
-                    for i in el:
-                        el[i] = f"\"{el[i]}\"" if type(el[i]) == str else str(el[i])
-                        res = ", " if not where_state else " AND "
-                        result += str(i) + " = " + el[i] + ("" if params[1] == params[0] else res)
-            else:
-                params[1] += 1
-                res = ", " if not where_state else " AND "
-                result += str(el) + ("" if params[1] == params[0] else res)
-    elif type(table) == str:
-        result = table
-    elif type(table) == dict:
-        params = [len(table), 0]
-        for el in table:
-            params[1] += 1
-            table[el] = f"\"{table[el]}\"" if type(table[el]) == str else str(table[el])
-            res = ", " if not where_state else " AND "
-            result += str(el) + " = " + table[el] + ("" if params[1] == params[0] else res)
-    return result
-
-class database:
-    def __init__(
-            self, 
-            db_name: str,
-            db_table: str,
-            db_values: str
-        ):
-        self.db = sqlite3.connect(db_name)
-        self.sql = self.db.cursor()
-        self.table = db_table
-
-        self.sql.execute(f"""CREATE TABLE IF NOT EXISTS {db_table}({db_values})""")
-        self.db.commit()
-
-    def select(self, need: list[dict] | str, where: str | dict | list[dict], all_state = False) -> dict | None:
-        result = ["", ""]
-        
-        if type(need) == str:
-            result[0] = need
-        elif type(need) == list:
-            params = [len(need), 0]
-            for el in need:
-                params[1] += 1
-                result[0] += str(el) + ("" if params[1] == params[0] else ", ")
-
-        result[1] = select_elements(where, True)
-
-        print(result[1])
-        self.sql.execute(f"SELECT {result[0]} FROM {self.table} WHERE {result[1]}")
-        result = self.sql.fetchone() if not all_state else self.sql.fetchall()
-
-        if result and len(result) == 0:
-            return None
-        
-        return result
-    
-    def insert(self, values: list | tuple | dict):
-        if type(values) == list or dict:
-            values = tuple(values)
-        
-        keys = "("
-        for i in range(len(values)):
-            if i != (len(values) - 1):
-                keys += "?,"
-            else:
-                keys += "?)"
-        self.sql.execute(f"INSERT INTO {self.table} VALUES {keys}", values)
-        self.db.commit()
-
-    def update(self, keys: str | dict | list[dict],  where: str | dict | list[dict]):
-        result = ["", ""]
-
-        result[0] = select_elements(keys)
-        result[1] = select_elements(where, True)
-
-    
-        self.sql.execute(f"UPDATE {self.table} SET {result[0]} WHERE {result[1]}")
-        self.db.commit()
-
-
-    def close(self):
-        self.db.close()
-
+"""Небольшой построитель SQL-запросов для sqlite3.
+
+Функции select/insert/update/delete возвращают пару (sql, params): значения
+всегда передаются параметрами "?", а в текст попадают только имена таблиц и
+колонок, которые проверяются регулярным выражением. Текст запроса зависит
+только от формы запроса (таблица, колонки, ключи условия) и кэшируется, а
+модуль sqlite3 держит подготовленные выражения по тексту запроса
+(cached_statements), поэтому запрос одной формы компилируется один раз.
+
+Ключ условия - имя колонки, за которым может идти оператор:
+    {"status": 1, "id !=": user_id, "search_started <": threshold}
+"""
+import re
+import sqlite3
+from functools import lru_cache
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_OPERATORS = {"=", "!=", "<", "<=", ">", ">=", "IS", "IS NOT", "LIKE"}
+
+
+def _name(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Недопустимое имя: {name!r}")
+    return name
+
+
+def _condition(key: str) -> str:
+    column, _, operator = key.strip().partition(" ")
+    operator = operator.strip().upper() or "="
+    if operator not in _OPERATORS:
+        raise ValueError(f"Недопустимый оператор: {operator!r}")
+    return f"{_name(column)} {operator} ?"
+
+
+@lru_cache(maxsize=512)
+def where_sql(keys: tuple) -> str:
+    return " AND ".join(_condition(key) for key in keys)
+
+
+@lru_cache(maxsize=512)
+def select_sql(table: str, columns: tuple, where: tuple, order_by: str = None, limit: bool = False) -> str:
+    sql = f"SELECT {', '.join(c if c == '*' else _name(c) for c in columns)} FROM {_name(table)}"
+    if where:
+        sql += f" WHERE {where_sql(where)}"
+    if order_by:
+        column, _, direction = order_by.partition(" ")
+        if direction.upper() not in ("", "ASC", "DESC"):
+            raise ValueError(f"Недопустимая сортировка: {order_by!r}")
+        sql += f" ORDER BY {_name(column)} {direction.upper()}".rstrip()
+    if limit:
+        sql += " LIMIT ?"
+    return sql
+
+
+@lru_cache(maxsize=512)
+def insert_sql(table: str, columns: tuple, conflict: str = None) -> str:
+    if conflict not in (None, "IGNORE", "REPLACE"):
+        raise ValueError(f"Недопустимое действие при конфликте: {conflict!r}")
+    verb = f"INSERT OR {conflict}" if conflict else "INSERT"
+    return (
+        f"{verb} INTO {_name(table)} ({', '.join(_name(c) for c in columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+
+
+@lru_cache(maxsize=512)
+def update_sql(table: str, columns: tuple, where: tuple) -> str:
+    sql = f"UPDATE {_name(table)} SET {', '.join(f'{_name(c)} = ?' for c in columns)}"
+    if where:
+        sql += f" WHERE {where_sql(where)}"
+    return sql
+
+
+@lru_cache(maxsize=512)
+def delete_sql(table: str, where: tuple) -> str:
+    sql = f"DELETE FROM {_name(table)}"
+    if where:
+        sql += f" WHERE {where_sql(where)}"
+    return sql
+
+
+def select(table: str, columns="*", where: dict = None, order_by: str = None, limit: int = None):
+    columns = (columns,) if isinstance(columns, str) else tuple(columns)
+    where = where or {}
+    params = tuple(where.values()) + ((limit,) if limit is not None else ())
+    return select_sql(table, columns, tuple(where), order_by, limit is not None), params
+
+
+def insert(table: str, values: dict, conflict: str = None):
+    return insert_sql(table, tuple(values), conflict), tuple(values.values())
+
+
+def update(table: str, values: dict, where: dict = None):
+    where = where or {}
+    return update_sql(table, tuple(values), tuple(where)), tuple(values.values()) + tuple(where.values())
+
+
+def delete(table: str, where: dict = None):
+    where = where or {}
+    return delete_sql(table, tuple(where)), tuple(where.values())
+
+
+def _merge(conditions) -> dict:
+    """Условие в виде dict или списка dict превращает в один dict"""
+    if isinstance(conditions, dict):
+        return conditions
+    merged = {}
+    for condition in conditions:
+        merged.update(condition)
+    return merged
+
+
+class database:
+    def __init__(
+            self,
+            db_name: str,
+            db_table: str,
+            db_values: str
+        ):
+        self.db = sqlite3.connect(db_name)
+        self.sql = self.db.cursor()
+        self.table = _name(db_table)
+
+        self.sql.execute(f"""CREATE TABLE IF NOT EXISTS {db_table}({db_values})""")
+        self.db.commit()
+
+    def select(self, need: list | str, where: dict | list[dict], all_state=False):
+        self.sql.execute(*select(self.table, need, _merge(where)))
+        result = self.sql.fetchone() if not all_state else self.sql.fetchall()
+        return result or None
+
+    def insert(self, values: list | tuple):
+        values = tuple(values)
+        self.sql.execute(f"INSERT INTO {self.table} VALUES ({', '.join('?' for _ in values)})", values)
+        self.db.commit()
+
+    def update(self, keys: dict | list[dict], where: dict | list[dict]):
+        self.sql.execute(*update(self.table, _merge(keys), _merge(where)))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,57 @@
+import logging
+import time
+
+logger = logging.getLogger("startup")
+
+
+class StartupTimer:
+    """Время фаз запуска: mark(name) закрывает фазу, начатую предыдущей отметкой.
+
+    Он же outer middleware для dp.update: один раз пишет в лог, через сколько
+    после старта пришёл первый апдейт.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = []
+        self._last = self.started
+        self._first_update = None
+
+    def mark(self, name: str):
+        now = time.monotonic()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self, title: str, *args):
+        """title - шаблон сообщения: у каждого отчёта свой, чтобы DedupFilter их не склеивал"""
+        total = time.monotonic() - self.started
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases)
+        logger.info(title + " через %.3f с: %s", *args, total, breakdown)
+
+    async def __call__(self, handler, event, data):
+        if self._first_update is None:
+            self._first_update = time.monotonic() - self.started
+            logger.info("Первый апдейт через %.3f с после старта", self._first_update)
+        return await handler(event, data)
+
+
+async def sync_webhook(bot, url: str, allowed_updates: list) -> bool:
+    """Ставит вебхук, только если url или allowed_updates отличаются от текущих.
+
+    Пустой allowed_updates у Telegram означает набор по умолчанию, в нём
+    нет message_reaction - такой вебхук тоже переустанавливается.
+    """
+    info = await bot.get_webhook_info()
+    if info.url == url and set(info.allowed_updates or ()) == set(allowed_updates):
+        return False
+    await bot.set_webhook(url, allowed_updates=allowed_updates)
+    return True
+
+
+async def sync_commands(bot, commands: list) -> bool:
+    """Обновляет меню команд, только если оно отличается от текущего"""
+    current = await bot.get_my_commands()
+    if [(c.command, c.description) for c in current] == [(c.command.lstrip("/"), c.description) for c in commands]:
+        return False
+    await bot.set_my_commands(commands)
+    return True
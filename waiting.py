@@ -0,0 +1,192 @@
+import asyncio
+import math
+import time
+
+from aiogram.exceptions import TelegramAPIError
+
+# Пользователи без интересов подходят всем и попадают в отдельную корзину
+ANY = ""
+
+
+class WaitEstimator:
+    """Темп прихода ищущих и фактическое время ожидания по корзинам интересов.
+
+    Приходы считаются счётчиками с экспоненциальным затуханием (постоянная
+    horizon секунд), поэтому история не хранится. Счётчик ведётся на набор
+    интересов целиком, а не на каждый интерес: пришедший с двумя интересами
+    совместим с ждущим по обоим, но заберёт его один раз.
+
+    Совместимость - как в MatchingStrategy.accepts, где выбирает пришедший:
+    пришедший без интересов берёт любого, пришедший с интересами - только
+    ждущего с общим интересом. Значит, ждущего с интересами забирают приходы
+    без интересов и с общим интересом, а ждущего без интересов - только
+    приходы без интересов (стратегия relax это ослабляет, оценка - нет).
+    """
+
+    # Наборы, от которых почти ничего не осталось, выбрасываются при оценке
+    FORGET_BELOW = 1e-3
+
+    def __init__(self, horizon: float = 600, smoothing: float = 0.2):
+        self.horizon = horizon
+        self.smoothing = smoothing
+        self._arrivals = {}  # frozenset интересов -> [затухающий счётчик, время обновления]
+        self._waits = {}  # корзина -> сглаженное фактическое ожидание, с
+
+    def _decay(self, counter: list, now: float) -> float:
+        if counter[1] is None:
+            counter[1] = now
+        elif now > counter[1]:
+            counter[0] *= math.exp((counter[1] - now) / self.horizon)
+            counter[1] = now
+        return counter[0]
+
+    def arrived(self, interests: set, now: float = None):
+        """Пользователь начал поиск"""
+        now = time.monotonic() if now is None else now
+        counter = self._arrivals.setdefault(frozenset(interests or ()), [0.0, None])
+        self._decay(counter, now)
+        counter[0] += 1
+
+    def matched(self, interests: set, waited: float):
+        """Ждавший waited секунд пользователь получил собеседника"""
+        for bucket in interests or (ANY,):
+            previous = self._waits.get(bucket)
+            self._waits[bucket] = waited if previous is None else previous + self.smoothing * (waited - previous)
+
+    def rate(self, interests: set, now: float = None) -> float:
+        """Сколько совместимых ищущих приходит в секунду"""
+        now = time.monotonic() if now is None else now
+        total = 0.0
+        for profile, counter in list(self._arrivals.items()):
+            count = self._decay(counter, now)
+            if count < self.FORGET_BELOW:
+                del self._arrivals[profile]
+            elif not profile or (interests and not profile.isdisjoint(interests)):
+                total += count
+        return total / self.horizon
+
+    def estimate(self, interests: set, position: int, now: float = None):
+        """Ожидаемое ожидание в секундах для position-го в очереди или None, если данных нет"""
+        rate = self.rate(interests, now)
+        if rate * self.horizon >= 1:
+            return position / rate
+        waits = [self._waits[bucket] for bucket in interests or (ANY,) if bucket in self._waits]
+        return min(waits) if waits else None
+
+
+class _Waiting:
+    __slots__ = ("interests", "started", "searched", "task")
+
+    def __init__(self, interests: set, started: float, searched: float):
+        self.interests = interests
+        self.started = started
+        self.searched = searched
+        self.task = None
+
+
+class SearchQueue:
+    """Ищущие пользователи в памяти: позиция в очереди и сообщение с оценкой ожидания.
+
+    Сообщение "Ищем собеседника" правится через edit_message_text не чаще,
+    чем по расписанию delays, и не больше len(delays) раз; правка без
+    изменения текста пропускается. Повторный поиск раньше research_after
+    секунд после прошлого прохода только показывает оценку заново.
+    """
+
+    def __init__(self, estimator: WaitEstimator = None, delays: tuple = (20, 40, 80, 160), research_after: float = 30):
+        self.estimator = estimator or WaitEstimator()
+        self.delays = delays
+        self.research_after = research_after
+        self.stats = {"searches": 0, "repeats": 0, "edits": 0}
+        self._waiting = {}
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._waiting
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    def searched(self, user_id: int, interests: set):
+        """Проход поиска: новый ищущий учитывается как приход, повторный - нет"""
+        self.stats["searches"] += 1
+        if user_id not in self._waiting:
+            self.estimator.arrived(interests)
+
+    def wait(self, user_id: int, interests: set):
+        """Собеседник не нашёлся: пользователь ждёт, время начала поиска сохраняется"""
+        now = time.monotonic()
+        previous = self.forget(user_id)
+        self._waiting[user_id] = _Waiting(interests, previous.started if previous else now, now)
+
+    def is_fresh(self, user_id: int) -> bool:
+        """Прошлый проход поиска был недавно и повторять его незачем"""
+        waiting = self._waiting.get(user_id)
+        if waiting is None or time.monotonic() - waiting.searched >= self.research_after:
+            return False
+        self.stats["repeats"] += 1
+        return True
+
+    def matched(self, user_id: int):
+        waiting = self.forget(user_id)
+        if waiting is not None:
+            self.estimator.matched(waiting.interests, time.monotonic() - waiting.started)
+
+    def forget(self, user_id: int):
+        """Пользователь больше не ищет: нашёл собеседника, отменил поиск или поиск истёк"""
+        waiting = self._waiting.pop(user_id, None)
+        if waiting is not None and waiting.task is not None:
+            waiting.task.cancel()
+        return waiting
+
+    def position(self, user_id: int) -> int:
+        """Место среди ждущих, которых заберёт тот же пришедший: дольше ждущий идёт первым.
+
+        Ждущего без интересов забирают только приходы без интересов, а они берут
+        любого - конкуренты все, кто ждёт дольше. Ждущего с интересами в основном
+        забирают приходы с общим интересом - конкуренты те, у кого он тоже есть.
+        """
+        waiting = self._waiting[user_id]
+        return 1 + sum(
+            1 for other in self._waiting.values()
+            if other.started < waiting.started
+            and (not waiting.interests or waiting.interests & other.interests)
+        )
+
+    def text(self, user_id: int) -> str:
+        waiting = self._waiting.get(user_id)
+        if waiting is None:
+            return "🔎 Ищем собеседника..."
+        position = self.position(user_id)
+        seconds = self.estimator.estimate(waiting.interests, position)
+        if seconds is None:
+            eta = "оценка появится чуть позже"
+        elif seconds < 60:
+            eta = "меньше минуты"
+        else:
+            eta = f"около {round(seconds / 60)} мин"
+        return f"🔎 Ищем собеседника...\n👥 Вы {position}-й в очереди, ожидание: {eta}"
+
+    def follow(self, user_id: int, bot, message):
+        """Запоминает сообщение с оценкой и запускает его редкие правки"""
+        waiting = self._waiting.get(user_id)
+        if waiting is None:
+            return
+        if waiting.task is not None:
+            waiting.task.cancel()
+        waiting.task = asyncio.create_task(self._refresh(user_id, bot, message))
+
+    async def _refresh(self, user_id: int, bot, message):
+        shown = message.text
+        for delay in self.delays:
+            await asyncio.sleep(delay)
+            if user_id not in self._waiting:
+                return
+            text = self.text(user_id)
+            if text == shown:
+                continue
+            try:
+                await bot.edit_message_text(text, chat_id=message.chat.id, message_id=message.message_id)
+            except TelegramAPIError:
+                return
+            shown = text
+            self.stats["edits"] += 1